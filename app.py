@@ -3,14 +3,51 @@ from streamlit_option_menu import option_menu
 
 import pandas as pd
 import numpy as np
-from dateutil.relativedelta import relativedelta
-import missingno as msno
-import matplotlib.pyplot as plt
 import plotly.graph_objects as go
 
+from checks import (HEADER_CHECKS, audit_timestamps, compare_header, duplicated_points, hist_point_table,
+                    timestamp_summary)
+from hist import read_hist_csv, scan_hist_csv
+from plots import decimated_traces, freeze_matrix_png, missing_matrix_png
+from profiling import HISTORY_COLUMNS, Profiler
+from store import HistStore, MemoryBudget, SessionHistStore
+from summary import SummaryWorker, plant_overview
+from tdt import TdtCache, content_key
+
 ## Setup page config
 st.set_page_config(page_title="Historical data", layout="wide")
 
+## Parsed TDT workbooks shared across reruns and sessions
+@st.cache_resource
+def get_tdt_cache():
+    return TdtCache(max_entries=8)
+
+## Parsed historical data kept on local disk across server restarts
+@st.cache_resource
+def get_hist_store():
+    return HistStore()
+
+## Memory budget shared by all sessions of this server process
+@st.cache_resource
+def get_memory_budget():
+    return MemoryBudget()
+
+## Background scorecards for the Summary tab, shared by all sessions
+@st.cache_resource
+def get_summary_worker():
+    return SummaryWorker(max_workers=2)
+
+SUMMARY_ROLL_HR = 6
+
+## Opt-in per-stage profiling of this rerun, the session keeps the last PROFILE_HISTORY_ROWS stages
+PROFILE_HISTORY_ROWS = 2000
+profile_on = st.sidebar.toggle('Profile this page', help='Record wall time, peak memory and payload size of each stage. Memory is traced for the whole server process, it slows every session down while on.')
+if 'profile_history' not in st.session_state:
+    st.session_state.profile_history = pd.DataFrame(columns=HISTORY_COLUMNS)
+    st.session_state.profile_rerun = 0
+st.session_state.profile_rerun += 1
+prof = Profiler(enabled=profile_on, rerun=st.session_state.profile_rerun)
+
 ## Sidebar markdown
 st.sidebar.markdown("## Select TDT")
 
@@ -18,48 +55,34 @@ st.sidebar.markdown("## Select TDT")
 uploaded_tdt = st.sidebar.file_uploader("Choose a file", type=['xlsx'])
 
 if uploaded_tdt is not None:
-    ## Read TDT excel file page "Point Survey"
-    df_tdt = pd.read_excel(uploaded_tdt, sheet_name="Point Survey")
-    df_tdt = df_tdt.drop(columns=["Unnamed: 0"])
-
-    st.markdown(f'# TDT name : {df_tdt.columns[0]}')
-
-    ## Remove none matric rows
-    df_dropna = df_tdt[~(df_tdt.iloc[:,0].str.contains("Metric Name|Add additional metrics as needed"))]
-
-    ## Find plant unit
-    plant_units = df_dropna.columns
-    plant_units = plant_units[~plant_units.str.contains("Unnamed")]
-    plant_units = plant_units.drop(plant_units[0])
-    num_unit = len(plant_units)
-
-    ## Create dataframe contain metric name and type
-    df_metrics = df_dropna.iloc[:,0:2].copy()
-
-    ## Create dataframe of each unit and contain to dict
-    units_tdt = dict()
-    for i in range(num_unit):
-        df_unit_point_name = df_dropna.iloc[:,i*5+2:i*5+7]
-        
-        df_unit_point_survey = pd.concat([df_metrics, df_unit_point_name], axis=1)
-        df_unit_point_survey.columns = df_unit_point_survey.iloc[0].tolist()
-        df_unit_point_survey = df_unit_point_survey.drop(0)
-        
-        units_tdt[plant_units[i]] = df_unit_point_survey
+    ## Parse TDT excel file page "Point Survey" once per file content
+    tdt_cache = get_tdt_cache()
+    with prof.stage('TDT parse'):
+        tdt = tdt_cache.get(uploaded_tdt.getvalue())
+    plant_units = tdt.plant_units
+    units_tdt = tdt.units_tdt
+    st.sidebar.caption(f'TDT cache : {tdt_cache.hits} hits / {tdt_cache.misses} misses ({len(tdt_cache)}/{tdt_cache.max_entries} entries)')
+    hist_store = get_hist_store()
+    st.sidebar.caption(f'Historical data cache : {hist_store.hits} hits / {hist_store.misses} misses ({hist_store.nbytes/1024**2:.0f}/{hist_store.max_bytes/1024**2:.0f} MB)')
+
+    st.markdown(f'# TDT name : {tdt.name}')
 
     ## Set st.session of tdt and historical dict
     def init_session_state():
         if 'tdt' not in st.session_state:
-            st.session_state.tdt = uploaded_tdt
-        if st.session_state.tdt != uploaded_tdt:
-            st.session_state.tdt = uploaded_tdt
+            st.session_state.tdt = tdt.key
+        if st.session_state.tdt != tdt.key:
+            st.session_state.tdt = tdt.key
             if 'hist_dict' in st.session_state:
                 del st.session_state.hist_dict
                 del st.session_state.hist_filename
+                del st.session_state.summary_futures
         if 'hist_dict' not in st.session_state:
-            st.session_state.hist_dict = {key: None for key in plant_units}
+            st.session_state.hist_dict = SessionHistStore(plant_units, hist_store, get_memory_budget())
         if 'hist_filename' not in st.session_state:
             st.session_state.hist_filename = {key: None for key in plant_units}
+        if 'summary_futures' not in st.session_state:
+            st.session_state.summary_futures = {}
 
     # Initialize session state
     init_session_state()
@@ -78,42 +101,102 @@ if uploaded_tdt is not None:
             st.markdown(f"### Upload historical data of {units}")
             with st.form("form", clear_on_submit=True):
                 uploaded_hist = st.file_uploader("Choose a file", type=['csv'])
+                stream_mode = st.checkbox('Large file (streaming mode)', help='Read the file in chunks. Missing proportions and the timestamp range use every row, freeze checks, tables and plots use every Nth row.')
+                keep_every = st.number_input('Keep every Nth row for plots', min_value=1, max_value=10000, value=10)
                 submitted = st.form_submit_button("Upload")
                 if submitted:
-                    st.session_state.hist_dict[units] = pd.read_csv(uploaded_hist)
+                    with prof.stage('CSV ingest'):
+                        if stream_mode:
+                            progress_bar = st.progress(0.0, text=f'Reading {uploaded_hist.name}')
+                            hist = scan_hist_csv(uploaded_hist, keep_every=int(keep_every),
+                                progress=lambda fraction: progress_bar.progress(fraction, text=f'Reading {uploaded_hist.name} : {fraction:.0%}'))
+                            st.session_state.hist_dict[units] = hist
+                            progress_bar.empty()
+                        else:
+                            ## Reuse the parsed dataset from the disk cache when the same file was loaded before
+                            hist_data_bytes = uploaded_hist.getvalue()
+                            hist = hist_store.load(content_key(hist_data_bytes), name=uploaded_hist.name)
+                            cached = hist is not None
+                            if not cached:
+                                hist = read_hist_csv(hist_data_bytes, name=uploaded_hist.name)
+                            ## The session store compacts the dataset (freeze runs on the float64 values, then
+                            ## float32 values), so the disk entry is saved compact with its run table
+                            st.session_state.hist_dict[units] = hist
+                            if not cached:
+                                hist_store.save(hist)
                     st.session_state.hist_filename[units] = uploaded_hist.name
+                    ## Start the Summary scorecard of this unit in the background. The local reference is used,
+                    ## another session can spill the unit to disk as soon as it is stored.
+                    st.session_state.summary_futures[units] = get_summary_worker().submit(
+                        tdt.key, units, units_tdt[units], hist, SUMMARY_ROLL_HR)
             st.markdown("---")
 
 
     ## Get point survey dataframe
     df_unit = units_tdt[units]
     ## Get historical dataframe from session
-    df_hist = st.session_state.hist_dict[units]
-    if df_hist is not None:     
+    with prof.stage('Load unit'):
+        hist = st.session_state.hist_dict[units]
+
+    ## Memory used by the historical data of each unit
+    hist_usage = st.session_state.hist_dict.usage()
+    if not hist_usage.empty:
+        st.sidebar.markdown("## Memory")
+        st.sidebar.dataframe(hist_usage, use_container_width=True, hide_index=True)
+        memory_budget = get_memory_budget()
+        st.sidebar.caption(f'Session : {st.session_state.hist_dict.nbytes/1024**2:.0f}/{st.session_state.hist_dict.max_bytes/1024**2:.0f} MB, '
+                           f'server : {memory_budget.nbytes/1024**2:.0f}/{memory_budget.max_bytes/1024**2:.0f} MB')
+    if hist is not None:     
         # Page select       
         selected = option_menu(None, ["Summary", "Format", "Header", "Timestamp", "Data"], 
                                 icons=["Summary", "Format", "Header", "Timestamp", "Data"], 
                                 default_index=0, orientation="horizontal")
         if selected == "Summary":
-            st.markdown('### Next version!!')
+            ## 0) Data quality scorecard of every unit -------------------------------------------------------------------------------------------------------------------
+            st.markdown("### 0) Data quality summary")
+            st.markdown(f'Scorecards are computed in the background when a unit is uploaded. Freeze window : {SUMMARY_ROLL_HR} hrs.')
+            summary_worker = get_summary_worker()
+            for unit in st.session_state.hist_dict.resident_units():
+                if unit not in st.session_state.summary_futures:
+                    ## None when the unit was spilled since resident_units(), it is submitted when viewed again
+                    unit_hist = st.session_state.hist_dict.peek(unit)
+                    if unit_hist is not None:
+                        st.session_state.summary_futures[unit] = summary_worker.submit(
+                            tdt.key, unit, units_tdt[unit], unit_hist, SUMMARY_ROLL_HR)
+
+            with prof.stage('Summary overview'):
+                overview = plant_overview(plant_units, st.session_state.summary_futures)
+                st.dataframe(prof.payload(overview), use_container_width=True, hide_index=True)
+            if (overview['Status'] == 'Computing').any():
+                st.button('Refresh')
+
+            st.markdown(f"##### Scorecard of {units}")
+            summary_future = st.session_state.summary_futures.get(units)
+            if summary_future is None or not summary_future.done():
+                st.write('Computing ...')
+            elif summary_future.exception() is not None:
+                st.write(f'<span style="color: red; font-weight:bold;">Error to summary :</span> {summary_future.exception()}', unsafe_allow_html=True)
+            else:
+                scorecard = summary_future.result()
+                show_issues = st.toggle('Show only tags with issues')
+                if show_issues:
+                    scorecard = scorecard[(scorecard['Header'] != 'Match') | ~scorecard['Timestamp valid']
+                                          | (scorecard['Missing (%)'] > 0) | (scorecard['Freeze (%)'] > 0)]
+                st.dataframe(prof.payload(scorecard), use_container_width=True, height=400)
         if selected == "Format":
             st.markdown("## Data table")
-            # cols_to_drop = [col for col in df_hist.columns if 'Unnamed' in col or 'TAG' in col]         # Drop columns with names containing 'Unnamed'
-            # df_hist.drop(columns=cols_to_drop, inplace=True)
         
 
             ## 1) Historical data format ----------------------------------------------------------------------------------------------------------------------------------
             st.markdown("### 1) Check the format structure matches the PRiSM Client format.")
-            st.dataframe(df_hist.head(6), use_container_width=True, height=300, hide_index=True)
+            with prof.stage('Format table'):
+                st.dataframe(prof.payload(hist.preview), use_container_width=True, height=300, hide_index=True)
 
         if selected == "Header":
             ## 2) Header of historical data check lists -------------------------------------------------------------------------------------------------------------------
             st.markdown("### 2) Header data comparison")
-            hist_head = df_hist.iloc[:4,:].copy()
-            hist_head_t = hist_head.T.reset_index()
-            hist_head_t.columns = hist_head_t.iloc[0].tolist()
-            hist_head_t = hist_head_t.drop(0)
-            hist_head_t['Point Name'] = hist_head_t['Point Name'].str.replace(r'V\..', 'V', regex=True)
+            with prof.stage('Header table'):
+                hist_head_t = hist_point_table(hist)
 
             ## 2.1) Check unique point name. -------------------------------------------------------------
             st.markdown("##### 2.1) [Hist] Point Name duplicated")
@@ -123,214 +206,187 @@ if uploaded_tdt is not None:
             else:
                 st.write('<mark>Point name in historical data are : :x: <span style="color: red; font-weight:bold;">Duplicated</span>.</mark>', unsafe_allow_html=True)
                 st.write('Table: Point name that are duplicated.')
-                st.dataframe(hist_head_t[hist_head_t['Point Name'].duplicated(keep=False)], use_container_width=True)
-
-            try:
-                ## 2.2) Check Point Name of historical data similar to Canary Point Name in TDT. ------------------------------------
-                st.markdown("##### 2.2) [Hist] Point Name == [TDT] Canary Point Name")
-                tdt_points = df_unit[df_unit['Point Type'] == "Analog"]['Canary Point Name']
-                hist_points = hist_head_t['Point Name']
-
-                tdt_points = tdt_points.reset_index().rename(columns={'index':'[TDT] Index', 'Canary Point Name':'[TDT] Canary Point Name'}).set_index('[TDT] Canary Point Name', drop=False)
-                hist_points = hist_points.reset_index().rename(columns={'index':'[Hist] Index', 'Point Name':'[Hist] Point Name'}).set_index('[Hist] Point Name', drop=False)
-                joined_points = pd.concat([tdt_points, hist_points], axis=1).reset_index(drop=True)
-                joined_points.index += 1
-                joined_points['Check'] = joined_points['[TDT] Canary Point Name'] == joined_points['[Hist] Point Name']
-
-                condition_2_2 = joined_points.isnull().values.any()
-                if not condition_2_2:
-                    st.write('<mark>Point name in historical data and TDT are : :white_check_mark: <span style="color: green; font-weight:bold;">Similar</span>.</mark>', unsafe_allow_html=True)
-                else:
-                    st.write('<mark>Point name in historical data and TDT are : :x: <span style="color: red; font-weight:bold;">Difference</span>.</mark>', unsafe_allow_html=True)
-                show_point = st.toggle('Show all Point Name')
-                if show_point:
-                    st.dataframe(joined_points, use_container_width=True)
-                else:
-                    if condition_2_2:
-                        st.dataframe(joined_points[joined_points.isnull().any(axis=1)], use_container_width=True)
-
-
-                ## 2.3) Check Discription of historical data similar to Canary Description in TDT. ------------------------------------
-                st.markdown("##### 2.3) [Hist] Description == [TDT] Canary Description")
-                tdt_desc = df_unit[df_unit['Point Type'] == "Analog"][['Canary Point Name', 'Canary Description']].set_index('Canary Point Name')
-                tdt_desc = tdt_desc.rename(columns={'Canary Description':'[TDT] Canary Description'})
-                hist_desc = hist_head_t[['Point Name', 'Description']].set_index('Point Name')
-                hist_desc = hist_desc.rename(columns={'Description':'[Hist] Description'})
-                compare_desc = pd.concat([tdt_desc, hist_desc], axis=1)
-                compare_desc['Check'] = compare_desc['[TDT] Canary Description'] == compare_desc['[Hist] Description']
-                if compare_desc['Check'].all():
-                    st.write('<mark>Description in historical data : :white_check_mark: <span style="color: green; font-weight:bold;">Similar</span>.</mark>', unsafe_allow_html=True)
-                else:
-                    st.write('<mark>Description in historical data : :x: <span style="color: red; font-weight:bold;">Difference</span>.</mark>', unsafe_allow_html=True)
-                
-                show_desc = st.toggle('Show all Description.')
-                if show_desc:
-                    st.dataframe(compare_desc)
-                else:
-                    if not compare_desc['Check'].all():
-                        st.dataframe(compare_desc[~compare_desc['Check']])
-
-
-                ## 2.4) Check Extended Name of historical data similar to Metric in TDT. --------------------------
-                st.markdown("##### 2.4) [Hist] Extended Name == [TDT] Metric")
-                tdt_exname = df_unit[df_unit['Point Type'] == "Analog"][['Canary Point Name', 'Metric']].set_index('Canary Point Name')
-                tdt_exname = tdt_exname.rename(columns={'Metric':'[TDT] Metric'})
-                hist_exname = hist_head_t[['Point Name', 'Extended Name']].set_index('Point Name')
-                hist_exname = hist_exname.rename(columns={'Extended Name':'[Hist] Extended Name'})
-                compare_exname = pd.concat([tdt_exname, hist_exname], axis=1)
-                compare_exname['Check'] = compare_exname['[TDT] Metric'] == compare_exname['[Hist] Extended Name']
-                if compare_exname['Check'].all():
-                    st.write('<mark>Extended Name in historical data and Metric in TDT : :white_check_mark: <span style="color: green; font-weight:bold;">Similar</span>.</mark>', unsafe_allow_html=True)
-                else:
-                    st.write('<mark>Extended Name in historical data and Metric in TDT : :x: <span style="color: red; font-weight:bold;">Difference</span>.</mark>', unsafe_allow_html=True)
-                
-                show_exname = st.toggle('Show all Extended Name')
-                if show_exname:
-                    st.dataframe(compare_exname)
-                else:
-                    if not compare_exname['Check'].all():
-                        st.dataframe(compare_exname[~compare_exname['Check']])
-
-
-                ## 2.5) Check Extended Description of historical data freely to fill. --------------------------
-                st.markdown("##### 2.5) [Hist] Extended Description == None")
-                hist_exdesc = hist_head_t[['Point Name', 'Extended Description']].set_index('Point Name')
-                hist_exdesc = hist_exdesc.rename(columns={'Extended Description':'[Hist] Extended Description'})
-                st.write('<mark>Description in historical data : :white_check_mark: <span style="color: green; font-weight:bold;">Freely to fill</span>.</mark>', unsafe_allow_html=True)
-                show_exdesc = st.toggle('Show all Extended Description')
-                if show_exdesc:
-                    st.dataframe(hist_exdesc)
-
-
-                ## 2.6) Check unit of historical data similar to unit in TDT. --------------------------
-                st.markdown("##### 2.4) [Hist] Unit == [TDT] Unit")
-                tdt_unit = df_unit[df_unit['Point Type'] == "Analog"][['Canary Point Name', 'Unit']].set_index('Canary Point Name')
-                tdt_unit = tdt_unit.rename(columns={'Unit':'[TDT] Unit'})
-                hist_unit = hist_head_t[['Point Name', 'Unit']].set_index('Point Name')
-                hist_unit = hist_unit.rename(columns={'Unit':'[Hist] Unit'})
-                compare_unit = pd.concat([tdt_unit, hist_unit], axis=1)
-                compare_unit['Check'] = compare_unit['[TDT] Unit'] == compare_unit['[Hist] Unit']
-                if compare_unit['Check'].all():
-                    st.write('<mark>Unit in historical data and Unit in TDT : :white_check_mark: <span style="color: green; font-weight:bold;">Similar</span>.</mark>', unsafe_allow_html=True)
-                else:
-                    st.write('<mark>Unit in historical data and Unit in TDT : :x: <span style="color: red; font-weight:bold;">Difference</span>.</mark>', unsafe_allow_html=True)
-                show_unit = st.toggle('Show all Unit')
-                if show_unit:
-                    st.dataframe(compare_unit)
+                st.dataframe(duplicated_points(hist_head_t), use_container_width=True)
+
+            ## All field checks come from one join of the TDT analog points and the historical header
+            with prof.stage('Header comparison'):
+                compare_head = compare_header(df_unit, hist_head_t)
+            if condition_2_1 or compare_head['Duplicated'].any():
+                st.write('Duplicated point names are paired by order of appearance.')
+
+            ## 2.2) Check Point Name of historical data similar to Canary Point Name in TDT. ------------------------------------
+            st.markdown("##### 2.2) [Hist] Point Name == [TDT] Canary Point Name")
+            joined_points = compare_head[['[TDT] Index', '[TDT] Canary Point Name', '[Hist] Index', '[Hist] Point Name', 'Duplicated', 'Name', 'Suggestion', 'Similarity']]
+            if compare_head['Name'].all():
+                st.write('<mark>Point name in historical data and TDT are : :white_check_mark: <span style="color: green; font-weight:bold;">Similar</span>.</mark>', unsafe_allow_html=True)
+            else:
+                st.write('<mark>Point name in historical data and TDT are : :x: <span style="color: red; font-weight:bold;">Difference</span>.</mark>', unsafe_allow_html=True)
+            show_point = st.toggle('Show all Point Name')
+            if show_point:
+                st.dataframe(joined_points, use_container_width=True)
+            else:
+                if not compare_head['Name'].all():
+                    st.dataframe(joined_points[~compare_head['Name']], use_container_width=True)
+
+            def show_header_check(check, label, toggle_label):
+                tdt_field, hist_field = HEADER_CHECKS[check]
+                compare = compare_head.loc[compare_head['Name'], ['[TDT] Canary Point Name', f'[TDT] {tdt_field}', f'[Hist] {hist_field}', check]]
+                compare = compare.set_index('[TDT] Canary Point Name').rename(columns={check:'Check'})
+                if compare['Check'].all():
+                    st.write(f'<mark>{label} : :white_check_mark: <span style="color: green; font-weight:bold;">Similar</span>.</mark>', unsafe_allow_html=True)
                 else:
-                    if not compare_unit['Check'].all():
-                        st.dataframe(compare_unit[~compare_unit['Check']])
-            except:
-                if condition_2_1:
-                    st.write('<span style="color: red; font-weight:bold;">Error to comparison :</span> Becourse Point name are duplicated.', unsafe_allow_html=True)
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.dataframe(df_unit["Canary Point Name"], use_container_width=True)
-                    with col2:
-                        st.dataframe(hist_head_t["Point Name"], use_container_width=True)
+                    st.write(f'<mark>{label} : :x: <span style="color: red; font-weight:bold;">Difference</span>.</mark>', unsafe_allow_html=True)
+                show_all = st.toggle(toggle_label)
+                if show_all:
+                    st.dataframe(compare)
                 else:
-                    st.write('<span style="color: red; font-weight:bold;">Error to comparison :</span> Please manual check.', unsafe_allow_html=True)
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.dataframe(df_unit, use_container_width=True)
-                    with col2:
-                        st.dataframe(hist_head_t, use_container_width=True)
-            
+                    if not compare['Check'].all():
+                        st.dataframe(compare[~compare['Check']])
+
+            st.caption('Checks 2.3, 2.4 and 2.6 compare only tags whose point names match, unmatched names are listed in 2.2.')
+
+            ## 2.3) Check Discription of historical data similar to Canary Description in TDT. ------------------------------------
+            st.markdown("##### 2.3) [Hist] Description == [TDT] Canary Description")
+            show_header_check('Description', 'Description in historical data', 'Show all Description.')
+
+            ## 2.4) Check Extended Name of historical data similar to Metric in TDT. --------------------------
+            st.markdown("##### 2.4) [Hist] Extended Name == [TDT] Metric")
+            show_header_check('Extended Name', 'Extended Name in historical data and Metric in TDT', 'Show all Extended Name')
+
+            ## 2.5) Check Extended Description of historical data freely to fill. --------------------------
+            st.markdown("##### 2.5) [Hist] Extended Description == None")
+            st.write('<mark>Description in historical data : :white_check_mark: <span style="color: green; font-weight:bold;">Freely to fill</span>.</mark>', unsafe_allow_html=True)
+            show_exdesc = st.toggle('Show all Extended Description')
+            if show_exdesc:
+                st.dataframe(compare_head.loc[compare_head['[Hist] Point Name'].notna(), ['[Hist] Point Name', '[Hist] Extended Description']].set_index('[Hist] Point Name'))
+
+            ## 2.6) Check unit of historical data similar to unit in TDT. --------------------------
+            st.markdown("##### 2.6) [Hist] Unit == [TDT] Unit")
+            show_header_check('Unit', 'Unit in historical data and Unit in TDT', 'Show all Unit')
 
 
         if selected == "Timestamp":
             ## 3) Check format timestamp -------------------------------------------------------------------------------------------------------------------
             st.markdown("### 3) Check format timestamp")
-            hist_data = df_hist.iloc[4:,:].copy()
-            hist_data = hist_data.rename(columns={"Point Name":"Datetime"}).set_index("Datetime")
-            try:
-                hist_data.index = pd.to_datetime(hist_data.index, format="%m/%d/%Y %H:%M")
+            with prof.stage('Timestamp summary'):
+                timestamp = timestamp_summary(hist)
+            if timestamp['format_ok']:
                 st.write('<mark>Datetime are in format **mm/dd/yy hh\:mm** : :white_check_mark: <span style="color: green; font-weight:bold;">Currect</span>.</mark>', unsafe_allow_html=True)
-            except:
+            else:
                 st.write('<mark>Datetime are in format **mm/dd/yy hh\:mm** : :x: <span style="color: red; font-weight:bold;">Incurrect</span>.</mark>', unsafe_allow_html=True)
-                hist_data.index = pd.to_datetime(hist_data.index)
         
-            start_date = hist_data.index.min()
-            end_date = hist_data.index.max()
-            difference = relativedelta(end_date, start_date)
-            st.write(f'<mark>Historical data start from <code>{start_date}</code> to <code>{end_date}</code></mark>', unsafe_allow_html=True)
-            st.write(f'''<mark>Duration: <code>{difference.years}</code> years 
-                                        <code>{difference.months}</code> months 
-                                        <code>{difference.days}</code> days 
-                                        <code>{difference.hours}</code> hours 
-                                        <code>{difference.minutes}</code> minutes</mark>''', unsafe_allow_html=True)
-            st.write(f'<mark>Time interval : <code>{hist_data.index.to_series().diff().min().seconds//60}</code> minutes</mark>', unsafe_allow_html=True)
-            st.write(f'<mark>Total points : <code>{hist_data.shape[0]}</code> points</mark>', unsafe_allow_html=True)
+            start_date = timestamp['start']
+            end_date = timestamp['end']
+            difference = timestamp['duration']
+            if difference is None:
+                st.write('<mark>Historical data start and duration : :x: <span style="color: red; font-weight:bold;">no valid timestamps</span>.</mark>', unsafe_allow_html=True)
+            else:
+                st.write(f'<mark>Historical data start from <code>{start_date}</code> to <code>{end_date}</code></mark>', unsafe_allow_html=True)
+                st.write(f'''<mark>Duration: <code>{difference.years}</code> years 
+                                            <code>{difference.months}</code> months 
+                                            <code>{difference.days}</code> days 
+                                            <code>{difference.hours}</code> hours 
+                                            <code>{difference.minutes}</code> minutes</mark>''', unsafe_allow_html=True)
+            st.write(f'<mark>Time interval : <code>{timestamp["interval_minutes"]}</code> minutes</mark>', unsafe_allow_html=True)
+            st.write(f'<mark>Total points : <code>{timestamp["total_points"]}</code> points</mark>', unsafe_allow_html=True)
+
+            ## 3.1) Row level timestamp audit, computed once per dataset -------------------------------
+            st.markdown("##### 3.1) Timestamp audit")
+            if hist.stats is not None:
+                st.info(f'Streaming mode : the audit covers every {hist.keep_every} rows only.')
+            with prof.stage('Timestamp audit'):
+                audit = audit_timestamps(hist)
+            for label, rows in [('Rows not in format mm/dd/yy hh:mm', audit.bad_format),
+                                ('Duplicated timestamps', audit.duplicated),
+                                ('Out-of-order timestamps', audit.out_of_order)]:
+                if rows.empty:
+                    st.write(f'<mark>{label} : :white_check_mark: <span style="color: green; font-weight:bold;">None</span>.</mark>', unsafe_allow_html=True)
+                else:
+                    st.write(f'<mark>{label} : :x: <span style="color: red; font-weight:bold;">{len(rows)}</span> rows.</mark>', unsafe_allow_html=True)
+                    with st.expander(f'Show {label.lower()}'):
+                        st.dataframe(rows, use_container_width=True, height=300)
+
+            st.markdown('**Sampling intervals**')
+            intervals = audit.intervals.head(20)
+            st.bar_chart(pd.Series(intervals.to_numpy(), index=intervals.index.astype(str), name='Count'))
+
+            interval = hist.sampling_interval
+            default_gap = int(interval.total_seconds()//60) * 3 if interval is not None else 60
+            gap_minutes = st.number_input('Show gaps longer than (minutes)', min_value=1, value=max(default_gap, 1))
+            gaps = audit.gaps(pd.Timedelta(minutes=gap_minutes))
+            st.write(f'<mark>Gaps longer than <code>{gap_minutes}</code> minutes : <code>{len(gaps)}</code></mark>', unsafe_allow_html=True)
+            if not gaps.empty:
+                st.dataframe(gaps, use_container_width=True, height=300)
 
 
         if selected == "Data":
             ## 4) Check data quality -------------------------------------------------------------------------------------------------------------------
             st.markdown("### 4) Check historian data quality")
-            hist_data = df_hist.iloc[4:,:].copy()
-            hist_data = hist_data.rename(columns={"Point Name":"Datetime"}).set_index("Datetime")
-            hist_data.index = pd.to_datetime(hist_data.index)
-
-            ## Change type from object to numeric and fill null for non-numeric
-            for col in hist_data.columns:
-                hist_data[col] = pd.to_numeric(hist_data[col], errors='coerce')
-
-            show_hist = st.toggle('Display historical dataframe')
-            if show_hist:
-                show_max = st.toggle('All data')
-                if show_max:
-                    st.markdown(f"**Historical data of {units}**")
-                    st.dataframe(hist_data, use_container_width=True, height=400)
-                else:
-                    st.markdown(f"**Historical data of {units}**")
-                    st.dataframe(hist_data.head(100), use_container_width=True, height=400)
+            ## Numeric values are parsed once on upload, non-numeric cells are null
+            hist_data = hist.frame()
+            if hist.stats is not None:
+                st.info(f'Streaming mode : missing proportions use all {hist.total_points} points. Freeze proportions, freeze episodes, '
+                        f'the matrices, the plots and the Summary coverage use every {hist.keep_every} rows only.')
+
+            with prof.stage('Historical dataframe'):
+                show_hist = st.toggle('Display historical dataframe')
+                if show_hist:
+                    show_max = st.toggle('All data')
+                    if show_max:
+                        st.markdown(f"**Historical data of {units}**")
+                        st.dataframe(prof.payload(hist_data), use_container_width=True, height=400)
+                    else:
+                        st.markdown(f"**Historical data of {units}**")
+                        st.dataframe(prof.payload(hist_data.head(100)), use_container_width=True, height=400)
 
             ## Shorten tag names by cutting out unnecessary text.
-            hist_data_short = hist_data.rename(columns=lambda x: x.replace('VIRTUAL_VIEW.LocalHistorian.', ''))
+            hist_data_short = hist.frame(short=True)
             
             ## 4) Check missing data -------------------------------
             st.markdown('##### 4.1) Missing data check')
             st.markdown('When data is present, the plot is shaded in grey and when it is absent the plot is displayed in white.')
             # Calculate the proportion of missing data for each column
-            missing_data_proportion = hist_data_short.isnull().mean()*100
-            missing_data_proportion.rename("Missing data proportion (%)", inplace=True)
+            with prof.stage('Missing proportion'):
+                missing_data_proportion = hist.missing_proportion().set_axis(hist.short_columns)
+                missing_data_proportion.rename("Missing data proportion (%)", inplace=True)
 
-            # Print column names and their proportion of missing data
-            st.dataframe(missing_data_proportion, use_container_width=True, height=300)
+                # Print column names and their proportion of missing data
+                st.dataframe(prof.payload(missing_data_proportion), use_container_width=True, height=300)
 
-            fig, ax = plt.subplots()
-            msno.matrix(hist_data_short, ax=ax, fontsize=7)
-            ax.set_title("Matrix visualization patterns in data completion")
-            st.set_option('deprecation.showPyplotGlobalUse', False)
-            _, col2, _ = st.columns([1,6,1])
-            with col2:
-                st.pyplot(fig, use_container_width=True)
+            with prof.stage('Missing matrix'):
+                _, col2, _ = st.columns([1,6,1])
+                with col2:
+                    st.image(prof.payload(missing_matrix_png(hist)), use_column_width=True)
 
             st.markdown('##### 4.2) Check Freeze data')
             st.markdown('When data is present, the plot is shaded in grey and when it is absent the plot is displayed in white.')
             roll_hr = st.slider(
                 'Select a window range to check freeze data (hrs.)',
                 1, 48, 6)
-            # roll_hr = 6
-            hist_data_fillna = hist_data.fillna(method='ffill')
-            rolling_std = hist_data_fillna.rolling(window=roll_hr*6).std()
-            rolling_std = rolling_std.mask(rolling_std < 0.0001)
+            ## Constant-value runs are found once per dataset, the window only changes a threshold
+            with prof.stage('Freeze runs'):
+                freeze_runs = hist.freeze_runs()
+                roll_window = freeze_runs.window_samples(roll_hr)
+            st.caption(f'Sampling interval : {hist.sampling_interval}, window : {roll_window} points')
+            if freeze_runs.interval is not None and pd.Timedelta(hours=roll_hr) < 2 * freeze_runs.interval:
+                st.caption(f'The window of {roll_hr} hrs. is shorter than two sampling intervals, freeze data is checked over 2 points.')
 
-            # Calculate the proportion of missing data for each column
-            freeze_data_proportion = rolling_std.isnull().mean()*100
-            freeze_data_proportion.rename("Missing data proportion (%)", inplace=True)
+            # Calculate the proportion of freeze data for each column
+            with prof.stage('Freeze proportion'):
+                freeze_data_proportion = freeze_runs.proportion(roll_window, hist.columns)
+                freeze_data_proportion.rename("Freeze data proportion (%)", inplace=True)
 
-            # Print column names and their proportion of missing data
-            st.dataframe(freeze_data_proportion, use_container_width=True, height=300)
-            # for column, proportion in missing_data_proportion.items():
-            #     st.write(f"Column '{column}' has missing data: {proportion:.2%}")
-            
-            rolling_std_short = rolling_std.rename(columns=lambda x: x.replace('VIRTUAL_VIEW.LocalHistorian.', ''))
-            fig, ax = plt.subplots()
-            msno.matrix(rolling_std_short, ax=ax, fontsize=7)
-            ax.set_title("Matrix visualization freeze data")
-            _, col2, _ = st.columns([1,6,1])
-            with col2:
-                st.pyplot(fig, use_container_width=True)
+                # Print column names and their proportion of freeze data
+                st.dataframe(prof.payload(freeze_data_proportion), use_container_width=True, height=300)
+
+            show_episodes = st.toggle('Show freeze episodes')
+            if show_episodes:
+                st.dataframe(freeze_runs.episodes(roll_window, hist.short_columns), use_container_width=True, hide_index=True)
+
+            with prof.stage('Freeze matrix'):
+                _, col2, _ = st.columns([1,6,1])
+                with col2:
+                    st.image(prof.payload(freeze_matrix_png(hist, roll_window)), use_column_width=True)
 
 
             # Create a figure
@@ -344,13 +400,26 @@ if uploaded_tdt is not None:
             #     ["lines", "markers", "lines+markers"]
             # )
             plot_select = "lines"
-            if not norm_select:
-                for column in options:
-                    fig.add_trace(go.Scatter(x=hist_data_short.index, y=hist_data_short[column], mode=plot_select, name=column))
-            else:
-                for column in options:
-                    hist_data_short_norm = (hist_data_short - hist_data_short.min()) / (hist_data_short.max() - hist_data_short.min())
-                    fig.add_trace(go.Scatter(x=hist_data_short_norm.index, y=hist_data_short_norm[column], mode=plot_select, name=column))
+            ## Zoom with the time range, each trace is re-decimated to the target point count
+            col1, col2 = st.columns([3,1])
+            with col1:
+                ## No range to choose from with a single timestamp or none that could be parsed
+                if pd.notna(hist.start) and pd.notna(hist.end) and hist.start < hist.end:
+                    ## One sampling interval per step (whole minutes), the default step is one day
+                    interval = hist.sampling_interval
+                    step = max(interval.round('min') if interval is not None else pd.Timedelta(0), pd.Timedelta(minutes=1))
+                    plot_range = st.slider('Time range', min_value=hist.start.to_pydatetime(), max_value=hist.end.to_pydatetime(),
+                                           value=(hist.start.to_pydatetime(), hist.end.to_pydatetime()),
+                                           step=step.to_pytimedelta(), format='YYYY-MM-DD HH:mm')
+                else:
+                    plot_range = (None, None)
+                    st.caption('Time range : the data has fewer than two distinct timestamps, all rows are plotted.')
+            with col2:
+                plot_points = st.select_slider('Points per trace', options=[500, 1000, 2000, 5000, 10000], value=2000)
+            with prof.stage('Plot traces'):
+                traces = decimated_traces(hist, options, start=plot_range[0], end=plot_range[1], n_points=plot_points, normalize=norm_select)
+                for column, x, y in traces:
+                    fig.add_trace(go.Scattergl(x=x, y=y, mode=plot_select, name=column))
 
             # Update figure layout
             fig.update_layout(
@@ -361,8 +430,26 @@ if uploaded_tdt is not None:
             )
 
             # Plot the figure using st.plotly_chart
-            st.plotly_chart(fig, use_container_width=True)
+            with prof.stage('Plot chart'):
+                st.plotly_chart(prof.payload(fig), use_container_width=True)
 
             st.dataframe(df_unit)
 
-            
+
+## Profiling panel of this rerun and the rolling history of the session
+if profile_on:
+    profile_rerun = prof.frame()
+    ## Empty frames are left out of the concat, pandas warns about their dtypes
+    history = st.session_state.profile_history
+    if history.empty:
+        history = profile_rerun
+    elif not profile_rerun.empty:
+        history = pd.concat([history, profile_rerun], ignore_index=True)
+    st.session_state.profile_history = history.tail(PROFILE_HISTORY_ROWS)
+    with st.expander('Profiling', expanded=True):
+        st.markdown(f'**Rerun {prof.rerun}** : {profile_rerun["Wall (ms)"].sum():.1f} ms in {len(profile_rerun)} stages')
+        st.dataframe(profile_rerun.drop(columns=['Rerun', 'Time']), use_container_width=True, hide_index=True)
+        st.markdown(f'**Session history** : last {len(st.session_state.profile_history)} stages')
+        st.dataframe(st.session_state.profile_history, use_container_width=True, hide_index=True, height=200)
+        st.download_button('Download history (CSV)', st.session_state.profile_history.to_csv(index=False),
+                           file_name='profile_history.csv', mime='text/csv')
@@ -0,0 +1,148 @@
+## Headless validator : run the checks of the app for every unit of a TDT.
+##
+##   python batch_check.py TDT.xlsx hist_csv_dir --json report.json --html report.html
+##
+## Each unit is matched to the CSV in the directory whose file name equals (or contains) the unit name,
+## compared word by word and number by number.
+import argparse
+import html
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+
+from checks import unit_report
+from hist import read_hist_csv, scan_hist_csv
+from tdt import parse_point_survey
+
+
+def _tokens(name):
+    ## Words and numbers of a name, "Unit 01" and "unit1" both give ('unit', '1')
+    return tuple(str(int(t)) if t.isdigit() else t for t in re.findall(r'[a-z]+|[0-9]+', str(name).lower()))
+
+
+def _contains(tokens, part):
+    return any(tokens[i:i + len(part)] == part for i in range(len(tokens) - len(part) + 1))
+
+
+def match_unit_files(plant_units, csv_dir):
+    files = {_tokens(os.path.splitext(f)[0]): os.path.join(csv_dir, f)
+             for f in sorted(os.listdir(csv_dir)) if f.lower().endswith('.csv')}
+    matched = {}
+    for unit in plant_units:
+        key = _tokens(unit)
+        if key in files:
+            matched[unit] = files[key]
+            continue
+        ## Whole words and numbers only, "Unit 1" does not match "unit10"
+        candidates = [path for tokens, path in files.items() if key and _contains(tokens, key)]
+        matched[unit] = candidates[0] if len(candidates) == 1 else None
+    return matched
+
+
+def check_unit(unit, df_unit, csv_path, roll_hr=6, max_missing=0.0, max_freeze=0.0, stream=False):
+    result = {'unit': unit, 'file': csv_path}
+    if csv_path is None:
+        result['status'] = 'missing file'
+        return result
+    try:
+        ## Compacted like the app : freeze runs on the float64 values, then float32 values
+        if stream:
+            hist = scan_hist_csv(csv_path, keep_every=1).compact()
+        else:
+            hist = read_hist_csv(csv_path).compact()
+        result['checks'] = unit_report(df_unit, hist, roll_hr=roll_hr, max_missing=max_missing, max_freeze=max_freeze)
+        result['status'] = 'passed' if all(c['passed'] for c in result['checks'].values()) else 'failed'
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = f'{type(e).__name__}: {e}'
+    return result
+
+
+def run_batch(tdt_path, csv_dir, workers=None, roll_hr=6, max_missing=0.0, max_freeze=0.0, stream=False):
+    with open(tdt_path, 'rb') as f:
+        tdt = parse_point_survey(f.read())
+    unit_files = match_unit_files(tdt.plant_units, csv_dir)
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(check_unit, unit, tdt.units_tdt[unit], path,
+                                   roll_hr, max_missing, max_freeze, stream): unit
+                   for unit, path in unit_files.items()}
+        for future in as_completed(futures):
+            unit = futures[future]
+            results[unit] = future.result()
+            print(f'{unit} : {results[unit]["status"]}', file=sys.stderr)
+
+    return {
+        'tdt': str(tdt.name),
+        'tdt_file': tdt_path,
+        'hist_dir': csv_dir,
+        'generated': datetime.now().isoformat(timespec='seconds'),
+        'window_hours': roll_hr,
+        'units': [results[unit] for unit in tdt.plant_units],
+    }
+
+
+def _details_html(details):
+    if isinstance(details, list):
+        return pd.DataFrame(details).to_html(index=False, na_rep='') if details else ''
+    if isinstance(details, dict):
+        return pd.Series(details, dtype=object).to_frame('Value').to_html(na_rep='')
+    return html.escape(str(details))
+
+
+def render_html(report):
+    parts = [f'<html><head><meta charset="utf-8"><title>Historical data check : {html.escape(report["tdt"])}</title>',
+             '<style>body{font-family:sans-serif} table{border-collapse:collapse;font-size:12px} '
+             'td,th{border:1px solid #ccc;padding:2px 6px} .passed{color:green} .failed,.error{color:red}</style></head><body>',
+             f'<h1>TDT name : {html.escape(report["tdt"])}</h1>',
+             f'<p>Generated {report["generated"]}, freeze window {report["window_hours"]} hrs.</p>']
+
+    overview = pd.DataFrame([{'Unit': r['unit'], 'File': r['file'], 'Status': r['status']} for r in report['units']])
+    parts.append(overview.to_html(index=False, na_rep=''))
+
+    for r in report['units']:
+        parts.append(f'<h2>{html.escape(str(r["unit"]))} : <span class="{r["status"].split()[0]}">{r["status"]}</span></h2>')
+        if 'error' in r:
+            parts.append(f'<p class="error">{html.escape(r["error"])}</p>')
+        for name, check in r.get('checks', {}).items():
+            status = 'passed' if check['passed'] else 'failed'
+            parts.append(f'<details><summary>{name} : <span class="{status}">{status}</span></summary>')
+            parts.append(_details_html(check.get('details')))
+            parts.append('</details>')
+    parts.append('</body></html>')
+    return '\n'.join(parts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check historical data of every unit in a TDT.')
+    parser.add_argument('tdt', help='TDT xlsx file with a "Point Survey" sheet')
+    parser.add_argument('hist_dir', help='directory of per-unit historical CSV files')
+    parser.add_argument('--json', default='report.json', help='JSON report path')
+    parser.add_argument('--html', default='report.html', help='HTML report path')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--window-hours', type=int, default=6, help='window range to check freeze data (hrs.)')
+    parser.add_argument('--max-missing', type=float, default=0.0, help='allowed missing data proportion per tag (%%)')
+    parser.add_argument('--max-freeze', type=float, default=0.0, help='allowed freeze data proportion per tag (%%)')
+    parser.add_argument('--stream', action='store_true', help='read CSV files in chunks')
+    args = parser.parse_args(argv)
+
+    report = run_batch(args.tdt, args.hist_dir, workers=args.workers, roll_hr=args.window_hours,
+                       max_missing=args.max_missing, max_freeze=args.max_freeze, stream=args.stream)
+    with open(args.json, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    with open(args.html, 'w', encoding='utf-8') as f:
+        f.write(render_html(report))
+
+    failed = [r['unit'] for r in report['units'] if r['status'] != 'passed']
+    print(f'{len(report["units"]) - len(failed)}/{len(report["units"])} units passed', file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,268 @@
+## Benchmark of every computation the app runs, on synthetic data.
+##
+##   python bench.py --units 4 --tags 300 --days 90 --interval 10 --out bench.json
+##
+## Generates a "Point Survey" workbook and one PRiSM-format CSV per unit with injected gaps,
+## freezes, non-numeric cells and header mismatches, then times each stage. Results are written
+## as JSON so runs of different versions can be compared.
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from checks import audit_timestamps, compare_header, hist_point_table, timestamp_summary
+from freeze import FREEZE_TOLERANCE, FreezeRuns, ffill_values, run_breaks
+from hist import TIMESTAMP_FORMAT, read_hist_csv
+from plots import decimated_traces, render_matrix
+from tdt import parse_point_survey
+
+
+UNIT_FIELDS = ['Canary Point Name', 'Canary Description', 'Unit', 'Low', 'High']
+
+
+def tag_name(unit, k):
+    return f'VIRTUAL_VIEW.LocalHistorian.U{unit:02d}.TAG{k:05d}.PV'
+
+
+def write_tdt(path, n_units, n_tags):
+    ## Column A is empty, B/C hold metric name and point type, then 5 columns per unit
+    unit_names = [f'Unit {u + 1}' for u in range(n_units)]
+    columns = ['', 'Synthetic TDT', 'Unnamed: 2']
+    for name in unit_names:
+        columns += [name] + [f'Unnamed: {len(columns) + i}' for i in range(1, 5)]
+    rows = [[None, 'Metric', 'Point Type'] + UNIT_FIELDS * n_units]
+    for k in range(n_tags):
+        row = [None, f'Metric {k}', 'Analog']
+        for u in range(n_units):
+            row += [tag_name(u, k), f'Description {k}', 'degC', 0, 100]
+        rows.append(row)
+    rows.append([None, 'Add additional metrics as needed', None] + [None] * (5 * n_units))
+    df = pd.DataFrame(rows)
+    df.columns = columns
+    df.to_excel(path, sheet_name='Point Survey', index=False)
+    return unit_names
+
+
+def write_hist_csv(path, unit, n_tags, days, interval_min, rng):
+    index = pd.date_range('2024-01-01', periods=int(days * 24 * 60 / interval_min), freq=f'{interval_min}min')
+    n_rows = len(index)
+    values = np.cumsum(rng.normal(size=(n_rows, n_tags)), axis=0).round(4)
+
+    ## Gaps in time, missing blocks and frozen blocks
+    keep = np.ones(n_rows, dtype=bool)
+    for start in rng.integers(0, n_rows, size=max(n_rows // 5000, 1)):
+        keep[start:start + rng.integers(5, 50)] = False
+    for tag in rng.choice(n_tags, size=max(n_tags // 10, 1), replace=False):
+        start = rng.integers(0, n_rows)
+        values[start:start + rng.integers(10, n_rows // 10 + 11), tag] = np.nan
+    for tag in rng.choice(n_tags, size=max(n_tags // 10, 1), replace=False):
+        start = rng.integers(0, n_rows)
+        values[start:start + rng.integers(50, n_rows // 5 + 51), tag] = values[start, tag]
+    ## One tag drifts by half the freeze tolerance per sample over the whole file
+    values[:, rng.integers(0, n_tags)] = 50 + np.arange(n_rows) * FREEZE_TOLERANCE / 2
+
+    data = pd.DataFrame(values, index=index.strftime(TIMESTAMP_FORMAT))[keep]
+    bad_tag = rng.integers(0, n_tags)
+    data[bad_tag] = data[bad_tag].astype(object)
+    data.iloc[rng.integers(0, len(data), size=10), bad_tag] = 'Bad'
+
+    ## Header mismatches : renamed tag, changed description and unit
+    names = [tag_name(unit, k) for k in range(n_tags)]
+    descriptions = [f'Description {k}' for k in range(n_tags)]
+    units = ['degC'] * n_tags
+    names[0] = names[0].replace('TAG', 'TG')
+    descriptions[1] = 'Changed description'
+    units[2] = 'bar'
+
+    with open(path, 'w', newline='') as f:
+        f.write(','.join(['Point Name'] + names) + '\n')
+        f.write(','.join(['Description'] + descriptions) + '\n')
+        f.write(','.join(['Extended Name'] + [f'Metric {k}' for k in range(n_tags)]) + '\n')
+        f.write(','.join(['Extended Description'] + [''] * n_tags) + '\n')
+        f.write(','.join(['Unit'] + units) + '\n')
+        data.to_csv(f, header=False)
+
+
+def timed(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return result, {'min': min(times), 'median': statistics.median(times), 'repeat': repeat}
+
+
+def ramp_case(n_rows=525_600, n_tags=50, repeat=3, seed=0):
+    ## FreezeRuns on a year of 1-minute noise, alone and with one tag drifting by half the tolerance
+    ## per sample. Every step is within the tolerance, so the whole tag is one run to split.
+    index = pd.date_range('2024-01-01', periods=n_rows, freq='1min')
+    values = np.random.default_rng(seed).normal(size=(n_rows, n_tags))
+    _, noise = timed(lambda: FreezeRuns(values, index), repeat)
+    values[:, 0] = np.arange(n_rows) * FREEZE_TOLERANCE / 2
+    _, ramp = timed(lambda: FreezeRuns(values, index), repeat)
+    return {'rows': n_rows, 'tags': n_tags, 'noise': noise, 'ramp': ramp}
+
+
+def freeze_check(window_hours=6, interval_min=10, n_rows=1000):
+    ## Freeze runs against the original rolling std rule on drifting, stepped and noisy series.
+    ## The rolling std has no value for the first window-1 rows, these are left out.
+    index = pd.date_range('2024-01-01', periods=n_rows, freq=f'{interval_min}min')
+    series = {
+        'drift': np.arange(n_rows) * FREEZE_TOLERANCE / 2,
+        'step': np.repeat(np.arange(10.0), -(-n_rows // 10))[:n_rows],
+        'noise': np.random.default_rng(0).normal(size=n_rows),
+    }
+    values = np.column_stack(list(series.values()))
+    freeze_runs = FreezeRuns(values, index)
+    window = freeze_runs.window_samples(window_hours)
+    expected = (pd.DataFrame(values).rolling(window).std() < FREEZE_TOLERANCE).to_numpy()[window - 1:]
+    frozen = freeze_runs.mask(window)[window - 1:]
+    return {name: {'frozen_pct': round(float(frozen[:, i].mean() * 100), 2),
+                   'rolling_std_frozen_pct': round(float(expected[:, i].mean() * 100), 2),
+                   'agree': bool((frozen[:, i] == expected[:, i]).all())}
+            for i, name in enumerate(series)}
+
+
+def reference_breaks(filled, tol=FREEZE_TOLERANCE):
+    ## Greedy run split of run_breaks, one sample at a time
+    breaks = np.ones(filled.T.shape, dtype=bool)
+    for tag, column in enumerate(filled.T):
+        low = high = np.nan
+        for row, x in enumerate(column):
+            if np.isnan(x) or np.isnan(low) or max(high, x) - min(low, x) > tol:
+                low = high = x
+                continue
+            breaks[tag, row] = False
+            low, high = min(low, x), max(high, x)
+    return breaks
+
+
+def run_breaks_check(n_series=300, windows=(2, 3, 5, 36), seed=0):
+    ## run_breaks and the freeze mask against the sample by sample reference, on short series
+    ## stepping by fractions of the tolerance with gaps of missing values
+    rng = np.random.default_rng(seed)
+    steps = np.array([0.0, 0.0, 0.0, 0.3, -0.4, 0.6, 0.95, 10.0]) * FREEZE_TOLERANCE
+    breaks_agree = mask_agree = True
+    for _ in range(n_series):
+        n_rows, n_tags = int(rng.integers(1, 80)), int(rng.integers(1, 4))
+        values = 5 + np.cumsum(rng.choice(steps, size=(n_rows, n_tags)), axis=0)
+        values[rng.random(values.shape) < 0.1] = np.nan
+        filled = ffill_values(values)
+        expected = reference_breaks(filled)
+        breaks_agree &= bool((run_breaks(filled) == expected).all())
+
+        freeze_runs = FreezeRuns(values, pd.date_range('2024-01-01', periods=n_rows, freq='10min'))
+        run_start = np.maximum.accumulate(np.where(expected, np.arange(n_rows), 0), axis=1)
+        run_length = (np.arange(n_rows) - run_start + 1).T
+        for window in windows:
+            frozen = (run_length >= window) | np.isnan(filled)
+            mask_agree &= bool((freeze_runs.mask(window) == frozen).all())
+            mask_agree &= bool(np.allclose(freeze_runs.proportion(window), frozen.mean(axis=0) * 100))
+    return {'series': n_series, 'windows': list(windows), 'breaks_agree': breaks_agree, 'mask_agree': mask_agree}
+
+
+def run(n_units, n_tags, days, interval_min, repeat=3, window_hours=6, workdir=None, seed=0):
+    rng = np.random.default_rng(seed)
+    workdir = workdir or tempfile.mkdtemp(prefix='hist_bench_')
+    os.makedirs(workdir, exist_ok=True)
+
+    tdt_path = os.path.join(workdir, 'tdt.xlsx')
+    unit_names = write_tdt(tdt_path, n_units, n_tags)
+    csv_paths = []
+    for u in range(n_units):
+        csv_paths.append(os.path.join(workdir, f'unit_{u + 1}.csv'))
+        write_hist_csv(csv_paths[-1], u, n_tags, days, interval_min, rng)
+
+    stages = {}
+    with open(tdt_path, 'rb') as f:
+        tdt_bytes = f.read()
+    tdt, stages['tdt_parse'] = timed(lambda: parse_point_survey(tdt_bytes), repeat)
+
+    units = []
+    for unit, path in zip(unit_names, csv_paths):
+        unit_stages = {}
+        with open(path, 'rb') as f:
+            csv_bytes = f.read()
+        ## Like the app : values are parsed as float64, the freeze runs are found on them, then the
+        ## dataset is compacted to float32 and every later stage runs on it
+        hist, unit_stages['csv_ingest'] = timed(lambda: read_hist_csv(csv_bytes, name=path), repeat)
+        freeze_runs, unit_stages['freeze_runs'] = timed(lambda: FreezeRuns(hist.values, hist.index), repeat)
+        hist.runs = freeze_runs
+        hist.compact()
+        df_unit = tdt.units_tdt[unit]
+
+        _, unit_stages['header_checks'] = timed(lambda: compare_header(df_unit, hist_point_table(hist)), repeat)
+        _, unit_stages['timestamp_check'] = timed(lambda: (timestamp_summary(hist), audit_timestamps(hist, cache=False)), repeat)
+        _, unit_stages['missing_proportion'] = timed(hist.missing_proportion, repeat)
+        window = freeze_runs.window_samples(window_hours)
+        _, unit_stages['freeze_window'] = timed(lambda: (freeze_runs.proportion(window), freeze_runs.mask(window)), repeat)
+        _, unit_stages['missing_matrix'] = timed(lambda: render_matrix(~np.isnan(hist.values), hist.index, hist.short_columns, 'missing'), repeat)
+        _, unit_stages['freeze_matrix'] = timed(lambda: render_matrix(~freeze_runs.mask(window), hist.index, hist.short_columns, 'freeze'), repeat)
+        selected = list(hist.short_columns[:12])
+        _, unit_stages['plot_traces'] = timed(lambda: decimated_traces(hist, selected, n_points=2000, normalize=True), repeat)
+
+        units.append({'unit': unit, 'rows': int(hist.values.shape[0]), 'tags': int(hist.values.shape[1]),
+                      'csv_bytes': len(csv_bytes), 'stages': unit_stages})
+
+    for name in units[0]['stages'] if units else []:
+        stages[name] = {'min': sum(u['stages'][name]['min'] for u in units),
+                        'median': sum(u['stages'][name]['median'] for u in units), 'repeat': repeat}
+
+    return {
+        'config': {'units': n_units, 'tags': n_tags, 'days': days, 'interval_min': interval_min,
+                   'window_hours': window_hours, 'repeat': repeat, 'seed': seed, 'dtype': 'float32'},
+        'environment': {'python': sys.version.split()[0], 'platform': platform.platform(),
+                        'numpy': np.__version__, 'pandas': pd.__version__},
+        'stages': stages,
+        'ramp_case': ramp_case(repeat=repeat, seed=seed),
+        'freeze_check': freeze_check(window_hours, interval_min),
+        'run_breaks_check': run_breaks_check(),
+        'units': units,
+    }, workdir
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the app computations on synthetic data.')
+    parser.add_argument('--units', type=int, default=2, help='number of plant units')
+    parser.add_argument('--tags', type=int, default=100, help='number of tags per unit')
+    parser.add_argument('--days', type=float, default=30, help='duration of historical data (days)')
+    parser.add_argument('--interval', type=int, default=10, help='sampling interval (minutes)')
+    parser.add_argument('--repeat', type=int, default=3, help='repeats per stage')
+    parser.add_argument('--window-hours', type=int, default=6, help='window range to check freeze data (hrs.)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default=None, help='keep generated files in this directory')
+    parser.add_argument('--out', default='bench.json', help='JSON result path')
+    args = parser.parse_args(argv)
+
+    result, workdir = run(args.units, args.tags, args.days, args.interval, repeat=args.repeat,
+                          window_hours=args.window_hours, workdir=args.workdir, seed=args.seed)
+    if args.workdir is None:
+        shutil.rmtree(workdir, ignore_errors=True)
+    with open(args.out, 'w') as f:
+        json.dump(result, f, indent=2)
+
+    for name, stage in result['stages'].items():
+        print(f'{name:20s} {stage["median"]*1000:10.1f} ms')
+    ramp = result['ramp_case']
+    print(f'freeze runs {ramp["rows"]} x {ramp["tags"]} : {ramp["noise"]["median"]*1000:.1f} ms, '
+          f'with one drifting tag {ramp["ramp"]["median"]*1000:.1f} ms')
+    for name, check in result['freeze_check'].items():
+        print(f'freeze check {name:7s} {check["frozen_pct"]:6.2f} % vs rolling std {check["rolling_std_frozen_pct"]:6.2f} % : '
+              f'{"agree" if check["agree"] else "DIFFER"}')
+    check = result['run_breaks_check']
+    print(f'run breaks check : {check["series"]} series, windows {check["windows"]} : '
+          f'{"agree" if check["breaks_agree"] and check["mask_agree"] else "DIFFER"}')
+    agree = all(check['agree'] for check in result['freeze_check'].values())
+    return 0 if agree and check['breaks_agree'] and check['mask_agree'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,280 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+from hist import TIMESTAMP_FORMAT
+
+
+## Checks shared by the Streamlit app and the batch validator (batch_check.py).
+## Each returns plain tables/values, rendering is left to the caller.
+
+def hist_point_table(hist):
+    ## Header of historical data, one row per tag numbered from 1
+    hist_head_t = hist.header.copy()
+    hist_head_t.index += 1
+    hist_head_t['Point Name'] = hist_head_t['Point Name'].str.replace(r'V\..', 'V', regex=True)
+    return hist_head_t
+
+
+def duplicated_points(hist_head_t):
+    return hist_head_t[hist_head_t['Point Name'].duplicated(keep=False)]
+
+
+def analog_points(df_unit):
+    return df_unit[df_unit['Point Type'] == "Analog"]
+
+
+## TDT field and historical header field behind each check of the header comparison
+HEADER_CHECKS = {
+    'Description': ('Canary Description', 'Description'),
+    'Extended Name': ('Metric', 'Extended Name'),
+    'Unit': ('Unit', 'Unit'),
+}
+
+
+def _trigrams(name):
+    name = f'  {str(name).lower()} '
+    return {name[i:i+3] for i in range(len(name) - 2)}
+
+
+## Trigram index over point names to suggest the closest name of an unmatched tag
+## without comparing it with every other name.
+class NameIndex:
+    def __init__(self, names, max_share=0.1, n_candidates=20):
+        self.names = list(names)
+        self.grams = [_trigrams(name) for name in self.names]
+        self.n_candidates = n_candidates
+        postings = {}
+        for position, grams in enumerate(self.grams):
+            for gram in grams:
+                postings.setdefault(gram, []).append(position)
+        ## Trigrams shared by most names (common prefixes) do not help to rank candidates
+        limit = max(int(len(self.names) * max_share), 50)
+        self.postings = {gram: np.array(p) for gram, p in postings.items() if len(p) <= limit}
+
+    def closest(self, name, min_score=0.3):
+        if not self.names:
+            return None, 0.0
+        grams = _trigrams(name)
+        hits = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not hits:
+            return None, 0.0
+        positions, counts = np.unique(np.concatenate(hits), return_counts=True)
+        candidates = positions[np.argsort(-counts, kind='stable')[:self.n_candidates]]
+
+        best, best_score = None, 0.0
+        for position in candidates:
+            other = self.grams[position]
+            score = len(grams & other) / len(grams | other)
+            if score > best_score:
+                best, best_score = self.names[position], score
+        if best_score < min_score:
+            return None, best_score
+        return best, best_score
+
+
+## One outer join of the TDT analog points and the historical header on point name.
+## Duplicated names are paired by order of appearance instead of failing the join.
+def compare_header(df_unit, hist_head_t):
+    tdt = analog_points(df_unit)[['Canary Point Name'] + [f for f, _ in HEADER_CHECKS.values()]]
+    tdt = tdt.rename(columns=lambda c: f'[TDT] {c}')
+    tdt['[TDT] Index'] = tdt.index
+    tdt['_name'] = tdt['[TDT] Canary Point Name']
+
+    hist = hist_head_t[['Point Name'] + [f for _, f in HEADER_CHECKS.values()] + ['Extended Description']]
+    hist = hist.rename(columns=lambda c: f'[Hist] {c}')
+    hist['[Hist] Index'] = hist.index
+    hist['_name'] = hist['[Hist] Point Name']
+
+    for side in (tdt, hist):
+        side['_occurrence'] = side.groupby('_name').cumcount()
+        side['_count'] = side.groupby('_name')['_name'].transform('size')
+
+    joined = tdt.merge(hist, on=['_name', '_occurrence'], how='outer', suffixes=('_tdt', '_hist'), sort=False)
+    joined['Duplicated'] = (joined['_count_tdt'].fillna(0) > 1) | (joined['_count_hist'].fillna(0) > 1)
+    joined['Name'] = joined['[TDT] Canary Point Name'].notna() & joined['[Hist] Point Name'].notna()
+    for check, (tdt_field, hist_field) in HEADER_CHECKS.items():
+        joined[check] = joined['Name'] & (joined[f'[TDT] {tdt_field}'] == joined[f'[Hist] {hist_field}'])
+
+    ## Closest name on the other side for every tag without a match
+    joined['Suggestion'] = None
+    joined['Similarity'] = np.nan
+    for own, other in (('[TDT] Canary Point Name', '[Hist] Point Name'), ('[Hist] Point Name', '[TDT] Canary Point Name')):
+        unmatched = joined[own].notna() & joined[other].isna()
+        if not unmatched.any():
+            continue
+        index = NameIndex(joined.loc[joined[other].notna() & joined[own].isna(), other].unique())
+        found = [index.closest(name) for name in joined.loc[unmatched, own]]
+        joined.loc[unmatched, 'Suggestion'] = [name for name, _ in found]
+        joined.loc[unmatched, 'Similarity'] = [round(score, 3) for _, score in found]
+
+    columns = ['[TDT] Index', '[TDT] Canary Point Name', '[Hist] Index', '[Hist] Point Name', 'Duplicated', 'Name', 'Suggestion', 'Similarity']
+    for check, (tdt_field, hist_field) in HEADER_CHECKS.items():
+        columns += [f'[TDT] {tdt_field}', f'[Hist] {hist_field}', check]
+    columns.append('[Hist] Extended Description')
+    result = joined[columns].reset_index(drop=True)
+    result[['[TDT] Index', '[Hist] Index']] = result[['[TDT] Index', '[Hist] Index']].astype('Int64')
+    result.index += 1
+    return result
+
+
+## Row level timestamp problems found in one vectorized pass over the raw timestamps
+@dataclass
+class TimestampAudit:
+    bad_format: pd.DataFrame
+    duplicated: pd.DataFrame
+    out_of_order: pd.DataFrame
+    intervals: pd.Series
+    steps: pd.Series
+
+    def gaps(self, threshold):
+        ## Steps between consecutive timestamps longer than the threshold
+        long_steps = self.steps[self.steps > threshold]
+        end = long_steps.index
+        start = end - long_steps.to_numpy()
+        return pd.DataFrame({'Start': start, 'End': end, 'Length': long_steps.to_numpy()})
+
+
+def audit_timestamps(hist, fmt=TIMESTAMP_FORMAT, cache=True):
+    ## Kept with the dataset, cache=False always recomputes (benchmarks)
+    if not cache:
+        return _audit_timestamps(hist, fmt)
+    return hist.cached(('timestamp_audit', fmt), lambda: _audit_timestamps(hist, fmt))
+
+
+def _audit_timestamps(hist, fmt):
+    rows = pd.RangeIndex(1, len(hist.raw_index) + 1, name='Row')
+    ## Rows not in the format were found while parsing, only other formats parse again
+    bad = hist.bad_timestamps
+    if bad is None or fmt != TIMESTAMP_FORMAT:
+        strict = pd.to_datetime(hist.raw_index, format=fmt, errors='coerce')
+        bad = np.asarray(strict.isna() & pd.notna(hist.raw_index))
+    bad_format = pd.DataFrame({'Timestamp': np.asarray(hist.raw_index[bad], dtype=object)}, index=rows[bad])
+
+    stamps = pd.Series(hist.index, index=rows)
+    duplicated = stamps[stamps.duplicated(keep=False) & stamps.notna()].to_frame('Datetime')
+
+    valid = stamps.dropna()
+    previous = valid.shift(1)
+    step = valid - previous
+    backwards = (step < pd.Timedelta(0)).to_numpy()
+    out_of_order = pd.DataFrame({'Datetime': valid[backwards], 'Previous': previous[backwards]})
+
+    positive = step[step > pd.Timedelta(0)]
+    intervals = positive.value_counts().sort_index().rename('Count')
+    intervals.index.name = 'Interval'
+    steps = pd.Series(step.to_numpy(), index=pd.DatetimeIndex(valid.to_numpy())).dropna()
+    return TimestampAudit(bad_format=bad_format, duplicated=duplicated, out_of_order=out_of_order,
+                          intervals=intervals, steps=steps)
+
+
+def timestamp_summary(hist):
+    ## start, end and duration are None when no timestamp could be parsed (or there are no rows)
+    start_date = hist.start
+    end_date = hist.end
+    if pd.notna(start_date) and pd.notna(end_date):
+        difference = relativedelta(end_date, start_date)
+    else:
+        start_date = end_date = difference = None
+    min_interval = hist.min_interval
+    return {
+        'format_ok': hist.timestamp_format_ok,
+        'start': start_date,
+        'end': end_date,
+        'duration': difference,
+        'interval_minutes': int(min_interval.total_seconds()//60) if pd.notna(min_interval) else None,
+        'total_points': hist.total_points,
+    }
+
+
+def freeze_proportion(hist, roll_hr):
+    freeze_runs = hist.freeze_runs()
+    return freeze_runs.proportion(freeze_runs.window_samples(roll_hr), hist.columns)
+
+
+## Data quality scorecard of one unit, one row per tag of the TDT or the historical data
+def unit_scorecard(df_unit, hist, roll_hr=6):
+    header = compare_header(df_unit, hist_point_table(hist))
+    audit = audit_timestamps(hist)
+    timestamp_ok = bool(hist.timestamp_format_ok and audit.duplicated.empty and audit.out_of_order.empty)
+
+    ## Header status of every tag
+    in_tdt = header['[TDT] Canary Point Name'].notna()
+    in_hist = header['[Hist] Point Name'].notna()
+    field_issues = pd.DataFrame({check: header['Name'] & ~header[check] for check in HEADER_CHECKS})
+    field_issues = field_issues.apply(lambda row: ', '.join(row.index[row]), axis=1)
+    status = pd.Series('Match', index=header.index)
+    status[field_issues != ''] = 'Differs : ' + field_issues
+    status[~in_tdt] = 'Not in TDT'
+    status[~in_hist] = 'Not in Hist'
+
+    scorecard = pd.DataFrame({
+        'Tag': header['[Hist] Point Name'].fillna(header['[TDT] Canary Point Name']),
+        'Header': status,
+        'Timestamp valid': timestamp_ok,
+        'Missing (%)': np.nan,
+        'Freeze (%)': np.nan,
+        'Coverage start': pd.NaT,
+        'Coverage end': pd.NaT,
+    }, index=header.index)
+
+    ## Per tag statistics, looked up by position of the tag in the historical data
+    position = header.loc[in_hist, '[Hist] Index'].astype('int64') - 1
+    scorecard.loc[position.index, 'Missing (%)'] = hist.missing_proportion().to_numpy()[position].round(2)
+    scorecard.loc[position.index, 'Freeze (%)'] = freeze_proportion(hist, roll_hr).to_numpy()[position].round(2)
+
+    valid = ~np.isnan(hist.values)
+    covered = position[valid.any(axis=0)[position]]
+    if len(covered):
+        first = valid.argmax(axis=0)
+        last = len(valid) - 1 - valid[::-1].argmax(axis=0)
+        scorecard.loc[covered.index, 'Coverage start'] = hist.index[first[covered]]
+        scorecard.loc[covered.index, 'Coverage end'] = hist.index[last[covered]]
+    scorecard = scorecard.reset_index(drop=True)
+    scorecard.index += 1
+    return scorecard
+
+
+## All checks of one unit as a JSON friendly dict
+def unit_report(df_unit, hist, roll_hr=6, max_missing=0.0, max_freeze=0.0):
+    def records(df):
+        return df.reset_index().replace({np.nan: None}).to_dict(orient='records')
+
+    report = {}
+    hist_head_t = hist_point_table(hist)
+    duplicated = duplicated_points(hist_head_t)
+    report['point_name_unique'] = {'passed': duplicated.empty, 'details': records(duplicated)}
+
+    header = compare_header(df_unit, hist_head_t)
+    name_columns = ['[TDT] Canary Point Name', '[Hist] Point Name', 'Duplicated', 'Suggestion', 'Similarity']
+    report['point_name'] = {'passed': bool(header['Name'].all()), 'details': records(header.loc[~header['Name'], name_columns])}
+    ## Field checks only compare tags whose point names match, like the app. Unmatched names
+    ## fail point_name only (the original app also flagged them as a field difference).
+    for check, (tdt_field, hist_field) in HEADER_CHECKS.items():
+        failed = header[header['Name'] & ~header[check]]
+        report[check.lower().replace(' ', '_')] = {'passed': failed.empty,
+                                                   'details': records(failed[['[TDT] Canary Point Name', f'[TDT] {tdt_field}', f'[Hist] {hist_field}']])}
+
+    timestamp = timestamp_summary(hist)
+    duration = timestamp.pop('duration')
+    if duration is None:
+        timestamp['duration'] = 'no valid timestamps'
+    else:
+        timestamp['duration'] = f'{duration.years} years {duration.months} months {duration.days} days {duration.hours} hours {duration.minutes} minutes'
+    audit = audit_timestamps(hist)
+    timestamp['bad_format_rows'] = len(audit.bad_format)
+    timestamp['duplicated_rows'] = len(audit.duplicated)
+    timestamp['out_of_order_rows'] = len(audit.out_of_order)
+    timestamp['intervals'] = {str(k): int(v) for k, v in audit.intervals.head(20).items()}
+    report['timestamp_format'] = {'passed': bool(timestamp['format_ok'] and timestamp['start'] is not None
+                                                 and audit.duplicated.empty and audit.out_of_order.empty),
+                                  'details': timestamp}
+
+    missing = hist.missing_proportion()
+    report['missing_data'] = {'passed': bool((missing <= max_missing).all()), 'details': missing.round(3).to_dict()}
+
+    freeze = freeze_proportion(hist, roll_hr)
+    report['freeze_data'] = {'passed': bool((freeze <= max_freeze).all()), 'window_hours': roll_hr, 'details': freeze.round(3).to_dict()}
+    return report
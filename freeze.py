@@ -0,0 +1,233 @@
+import numpy as np
+import pandas as pd
+
+
+FREEZE_TOLERANCE = 0.0001
+
+
+def ffill_values(values):
+    ## Forward fill a (rows x tags) matrix along rows, leading nulls stay null
+    n_rows, n_tags = values.shape
+    missing = np.isnan(values)
+    with_missing = np.flatnonzero(missing.any(axis=0))
+    if len(with_missing) == 0:
+        return values
+    last = np.where(missing[:, with_missing], 0, np.arange(n_rows)[:, None])
+    np.maximum.accumulate(last, axis=0, out=last)
+    filled = values.copy()
+    filled[:, with_missing] = values[last, with_missing]
+    return filled
+
+
+def run_breaks(filled, tol=FREEZE_TOLERANCE, max_batch=1 << 18):
+    ## (tags x rows) mask of the samples that start a new run. A run goes on while the spread
+    ## (max - min) of its values stays within the tolerance, so a slow drift is not a freeze.
+    values = np.ascontiguousarray(filled.T)
+    n_tags, n_rows = values.shape
+    breaks = np.ones(values.shape, dtype=bool)
+    if n_rows < 2:
+        return breaks
+    ## A step over the tolerance always breaks the run, NaN steps (no data yet) too
+    np.logical_not(np.abs(np.diff(values, axis=1)) <= tol, out=breaks[:, 1:])
+
+    ## Only runs between such steps that spread over the tolerance need to be split further
+    flat = values.ravel()
+    flat_breaks = breaks.ravel()
+    is_last = np.ones(flat.shape, dtype=bool)
+    is_last[:-1] = flat_breaks[1:]
+    first = np.flatnonzero(flat_breaks & ~is_last)
+    if len(first) == 0:
+        return breaks
+    last = np.flatnonzero(~flat_breaks & is_last)
+    ## reduceat reduces from one bound to the next, so each run is bounded by [first, last + 1).
+    ## The bound past the end of the array is left out, the last run then goes to the end.
+    bounds = np.column_stack([first, last + 1]).ravel()
+    if bounds[-1] == len(flat):
+        bounds = bounds[:-1]
+    spread = np.maximum.reduceat(flat, bounds)[::2] - np.minimum.reduceat(flat, bounds)[::2]
+    drifting = spread > tol
+    if not drifting.any():
+        return breaks
+
+    ## Split the drifting runs, in batches of about max_batch samples to bound the lookup tables
+    first, length = first[drifting], (last - first + 1)[drifting]
+    batch = np.cumsum(length) // max_batch
+    for b in np.unique(batch):
+        in_batch = batch == b
+        flat_breaks[split_drifting(flat, first[in_batch], length[in_batch], tol)] = True
+    return breaks
+
+
+def split_drifting(flat, first, length, tol=FREEZE_TOLERANCE):
+    ## Flat positions where the greedy split starts a new run inside the segments flat[first:first+length].
+    ## The split is sequential (each run starts where the previous one broke), so instead of walking
+    ## sample by sample : 1) a sparse table of window max/min gives, for every sample, where a run
+    ## starting there would break (binary lifting), 2) pointer doubling on that "next start" follows
+    ## the chain of runs from each segment start. Both take O(log n) vectorized passes.
+    n = int(length.sum())
+    index_dtype = np.int32 if n < np.iinfo(np.int32).max // 2 else np.int64
+    length = length.astype(index_dtype)
+    offset = np.cumsum(length, dtype=index_dtype) - length
+    pos = np.arange(n, dtype=index_dtype) - np.repeat(offset, length)
+    x = flat[np.repeat(first, length) + pos]
+    end = np.repeat(offset + length, length)
+    i = np.arange(n, dtype=index_dtype)
+
+    ## highs[k][i], lows[k][i] : max and min of x[i:i+2**k], levels are added until no window
+    ## inside a segment spreads within the tolerance
+    highs, lows = [x], [x]
+    while True:
+        k = len(highs)
+        size = 1 << k
+        half = np.minimum(i + size // 2, n - 1)
+        high = np.maximum(highs[-1], highs[-1][half])
+        low = np.minimum(lows[-1], lows[-1][half])
+        if not ((i + size <= end) & (high - low <= tol)).any():
+            break
+        highs.append(high)
+        lows.append(low)
+
+    ## Longest run from each sample : extend by 2**k samples while the spread stays within the tolerance
+    reach = i + 1
+    high, low = x.copy(), x.copy()
+    for k in range(len(highs) - 1, -1, -1):
+        at = np.minimum(reach, n - 1)
+        new_high = np.maximum(high, highs[k][at])
+        new_low = np.minimum(low, lows[k][at])
+        extend = (reach + (1 << k) <= end) & (new_high - new_low <= tol)
+        reach[extend] += 1 << k
+        high[extend] = new_high[extend]
+        low[extend] = new_low[extend]
+    del highs, lows, high, low
+
+    ## next_start[i] : start of the run after a run starting at i, n past the end of the segment.
+    ## jumps[k] follows it 2**k times, levels are added until every segment start jumps past the end.
+    next_start = np.append(np.where(reach < end, reach, n), n).astype(index_dtype)
+    jumps = [next_start]
+    while (jumps[-1][offset] < n).any():
+        jumps.append(jumps[-1][jumps[-1]])
+    ## The runs reached from s by steps of 2**k are those reached by steps of 2**(k+1) and one step after them
+    starts = offset
+    for jump in reversed(jumps[:-1]):
+        starts = np.concatenate([starts, jump[starts]])
+        starts = starts[starts < n]
+    starts = np.setdiff1d(starts, offset)
+    return first[np.searchsorted(offset, starts, side='right') - 1] + pos[starts]
+
+
+## Constant-value runs of every tag, computed once per dataset and kept as a compact run table.
+## Runs are split greedily : a run goes on while the spread of all its values so far stays within
+## the tolerance and the sample that breaks it starts the next run. A sample is frozen for a window
+## of w samples when it is at least the w-th sample of its run. This is stricter than "the last w
+## values spread by no more than the tolerance" : a slow drift that split a run just before the
+## sample leaves it not frozen even if its last w values are within the tolerance.
+class FreezeRuns:
+    def __init__(self, values, index, tol=FREEZE_TOLERANCE):
+        self.tol = tol
+        self.index = index
+        self.interval = sampling_interval(index)
+        self.n_rows, self.n_tags = values.shape
+
+        ## Rows before the first value of a tag have no data, even after the forward fill
+        valid = ~np.isnan(values)
+        first_valid = valid.argmax(axis=0) if self.n_rows else 0
+        self.first_valid = np.where(valid.any(axis=0), first_valid, self.n_rows).astype(np.int32)
+        del valid
+        breaks = run_breaks(ffill_values(values), tol)
+
+        ## Run table (tag, first row, length) of the runs of two samples or more, runs of null
+        ## values are left out. A live signal starts a run at almost every sample, keeping
+        ## single-sample runs would make the table as large as the values.
+        starts_long = np.zeros(breaks.shape, dtype=bool)
+        ends_long = ~breaks
+        np.logical_and(breaks[:, :-1], ends_long[:, 1:], out=starts_long[:, :-1])
+        ends_long[:, :-1] &= breaks[:, 1:]
+        tag, first = np.nonzero(starts_long)
+        _, last = np.nonzero(ends_long)
+        keep = first >= self.first_valid[tag]
+        self.run_tag = tag[keep].astype(np.int32)
+        self.run_first = first[keep].astype(np.int32)
+        self.run_length_total = (last - first + 1)[keep].astype(np.int32)
+
+    @classmethod
+    def from_table(cls, index, n_tags, first_valid, run_tag, run_first, run_length_total, tol=FREEZE_TOLERANCE):
+        ## Runs read back from a saved run table
+        runs = cls.__new__(cls)
+        runs.tol = tol
+        runs.index = index
+        runs.interval = sampling_interval(index)
+        runs.n_rows, runs.n_tags = len(index), n_tags
+        runs.first_valid = np.asarray(first_valid, dtype=np.int32)
+        runs.run_tag = np.asarray(run_tag, dtype=np.int32)
+        runs.run_first = np.asarray(run_first, dtype=np.int32)
+        runs.run_length_total = np.asarray(run_length_total, dtype=np.int32)
+        return runs
+
+    @property
+    def nbytes(self):
+        return self.first_valid.nbytes + self.run_tag.nbytes + self.run_first.nbytes + self.run_length_total.nbytes
+
+    def window_samples(self, hours):
+        ## At least two samples, one sample is always constant
+        interval = self.interval
+        if interval is None or interval <= pd.Timedelta(0):
+            return 2
+        return max(int(round(pd.Timedelta(hours=hours) / interval)), 2)
+
+    def mask(self, window):
+        ## (rows x tags) mask, True where the sample is frozen or there is no data yet, like the
+        ## masked rolling std. Built from the run table : +1 where a frozen stretch starts, -1 past
+        ## its end, stretches of a tag never overlap so the running sum is 0 or 1.
+        if window <= 1:
+            return np.ones((self.n_rows, self.n_tags), dtype=bool)
+        long_run = self.run_length_total >= window
+        tag = self.run_tag[long_run]
+        start = self.run_first[long_run] + (window - 1)
+        stop = self.run_first[long_run] + self.run_length_total[long_run]
+        no_data = np.flatnonzero(self.first_valid)
+        tag = np.concatenate([tag, no_data])
+        start = np.concatenate([start, np.zeros(len(no_data), dtype=np.int32)])
+        stop = np.concatenate([stop, self.first_valid[no_data]])
+
+        delta = np.zeros((self.n_rows + 1, self.n_tags), dtype=np.int8)
+        flat = delta.reshape(-1)
+        np.add.at(flat, start.astype(np.int64) * self.n_tags + tag, 1)
+        np.add.at(flat, stop.astype(np.int64) * self.n_tags + tag, -1)
+        np.cumsum(delta, axis=0, out=delta)
+        return delta[:-1].view(bool)
+
+    def proportion(self, window, columns=None):
+        ## Percentage of frozen or no-data samples per tag, from the run table only.
+        ## With a window of one sample every sample is frozen, like a rolling std of one value
+        if window <= 1:
+            return pd.Series(np.full(self.n_tags, 100.0 if self.n_rows else 0.0), index=columns)
+        frozen_count = np.maximum(self.run_length_total - window + 1, 0)
+        frozen = np.bincount(self.run_tag, weights=frozen_count, minlength=self.n_tags)
+        frozen += self.first_valid
+        return pd.Series(frozen / max(self.n_rows, 1) * 100, index=columns)
+
+    def episodes(self, window, columns=None):
+        ## One row per run that stays constant for at least the window (and two samples)
+        long_run = self.run_length_total >= window
+        tag = self.run_tag[long_run]
+        first = self.run_first[long_run]
+        last = first + self.run_length_total[long_run] - 1
+        start = self.index[first]
+        end = self.index[last]
+        names = np.asarray(columns)[tag] if columns is not None else tag
+        return pd.DataFrame({
+            'Tag': names,
+            'Start': start,
+            'End': end,
+            'Duration': end - start,
+            'Points': self.run_length_total[long_run],
+        })
+
+
+def sampling_interval(index):
+    ## Typical sampling interval, the median of the positive steps between timestamps
+    steps = index[~index.isna()].to_series().diff()
+    steps = steps[steps > pd.Timedelta(0)]
+    if len(steps) == 0:
+        return None
+    return steps.median()
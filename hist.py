@@ -0,0 +1,301 @@
+import io
+import uuid
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from freeze import FREEZE_TOLERANCE, FreezeRuns, sampling_interval
+from tdt import content_key
+
+
+HEADER_FIELDS = ["Point Name", "Description", "Extended Name", "Extended Description", "Unit"]
+TIMESTAMP_FORMAT = "%m/%d/%Y %H:%M"
+SHORT_PREFIX = 'VIRTUAL_VIEW.LocalHistorian.'
+
+
+## Quality statistics of a full file, computed while streaming it in chunks
+@dataclass
+class HistStats:
+    missing: pd.Series
+    start: pd.Timestamp
+    end: pd.Timestamp
+    min_interval: pd.Timedelta
+    total_points: int
+
+
+## Historical data of one unit in PRiSM Client format, parsed once on upload.
+## header : one row per tag with HEADER_FIELDS columns
+## raw_index : timestamp strings as written in the file, held as Arrow strings
+## index : parsed datetime64 index
+## values : contiguous (rows x tags) float matrix, non-numeric cells are NaN
+## stats : full-file statistics when values only hold every keep_every-th row (streaming mode)
+## bad_timestamps : rows whose timestamp does not match TIMESTAMP_FORMAT, found while parsing
+## runs : freeze runs found on the float64 values before compact() rounds them to float32
+@dataclass(eq=False)
+class HistDataset:
+    name: str
+    header: pd.DataFrame
+    raw_index: pd.Index
+    index: pd.DatetimeIndex
+    values: np.ndarray
+    preview: pd.DataFrame
+    timestamp_format_ok: bool
+    stats: HistStats = None
+    keep_every: int = 1
+    key: str = None
+    bad_timestamps: np.ndarray = None
+    runs: FreezeRuns = None
+    _derived: dict = field(default_factory=dict, repr=False)
+    _size: int = field(default=None, repr=False)
+
+    @property
+    def columns(self):
+        return pd.Index(self.header['Point Name'])
+
+    @property
+    def short_columns(self):
+        return self.columns.str.replace(SHORT_PREFIX, '', regex=False)
+
+    def frame(self, short=False):
+        columns = self.short_columns if short else self.columns
+        return pd.DataFrame(self.values, index=self.index, columns=columns, copy=False)
+
+    @property
+    def start(self):
+        return self.stats.start if self.stats is not None else self.index.min()
+
+    @property
+    def end(self):
+        return self.stats.end if self.stats is not None else self.index.max()
+
+    @property
+    def min_interval(self):
+        ## Smallest positive step between consecutive timestamps
+        if self.stats is not None:
+            return self.stats.min_interval
+        steps = self.index.to_series().diff()
+        return steps[steps > pd.Timedelta(0)].min()
+
+    @property
+    def total_points(self):
+        return self.stats.total_points if self.stats is not None else self.values.shape[0]
+
+    @property
+    def sampling_interval(self):
+        return sampling_interval(self.index)
+
+    def cached(self, key, compute):
+        ## Results derived from the values are computed once and kept with the dataset
+        if key not in self._derived:
+            value = self._derived[key] = compute()
+            if self._size is not None:
+                self._size += _nbytes(value)
+        return self._derived[key]
+
+    def freeze_runs(self, tol=FREEZE_TOLERANCE):
+        if self.runs is not None and self.runs.tol == tol:
+            return self.runs
+        return self.cached(('freeze_runs', tol), lambda: FreezeRuns(self.values, self.index, tol=tol))
+
+    def missing_proportion(self):
+        ## Proportion of missing data for each column in percent
+        if self.stats is not None:
+            return self.stats.missing.copy()
+        missing = self.cached('missing_proportion', lambda: pd.Series(
+            np.isnan(self.values).sum(axis=0) / max(self.values.shape[0], 1) * 100, index=self.columns))
+        return missing.copy()
+
+    def compact(self):
+        ## float32 values and categorical header fields, derived results are dropped when values change.
+        ## A step of 1e-4 is below float32 resolution above about 1024, so the freeze runs are found
+        ## on the float64 values first and kept.
+        if self.values.dtype != np.float32:
+            if self.runs is None and self.values.dtype == np.float64:
+                self.runs = FreezeRuns(self.values, self.index)
+            self.values = self.values.astype(np.float32)
+            self._derived.clear()
+        for col in HEADER_FIELDS[1:]:
+            if col in self.header and not isinstance(self.header[col].dtype, pd.CategoricalDtype):
+                self.header[col] = self.header[col].astype('category')
+        self._size = None
+        self._size = self.nbytes
+        return self
+
+    @property
+    def nbytes(self):
+        ## Memory held by the dataset, including results cached with it. Measured once, results
+        ## cached later are added as they are computed.
+        if self._size is None:
+            total = self.values.nbytes + self.index.nbytes + _nbytes(self.raw_index)
+            total += self.bad_timestamps.nbytes if self.bad_timestamps is not None else 0
+            total += self.runs.nbytes if self.runs is not None else 0
+            total += self.header.memory_usage(deep=True).sum() + self.preview.memory_usage(deep=True).sum()
+            self._size = int(total + sum(_nbytes(value) for value in self._derived.values()))
+        return self._size
+
+
+def _nbytes(value):
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (np.ndarray, FreezeRuns)):
+        return value.nbytes
+    if isinstance(value, (pd.Series, pd.DataFrame, pd.Index)):
+        return int(np.sum(value.memory_usage(deep=True)))
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(v) for v in value)
+    if hasattr(value, '__dict__'):
+        return sum(_nbytes(v) for v in vars(value).values())
+    return 0
+
+
+def _to_bytes(source):
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if hasattr(source, 'getvalue'):
+        return source.getvalue()
+    if hasattr(source, 'read'):
+        return source.read()
+    with open(source, 'rb') as f:
+        return f.read()
+
+
+def arrow_strings(strings):
+    ## Strings as an Arrow-backed index, sized without walking Python objects
+    array = pa.array(np.asarray(strings, dtype=object), type=pa.string(), from_pandas=True)
+    return pd.Index(pd.arrays.ArrowStringArray(array))
+
+
+def build_header(head):
+    ## First 4 rows under the "Point Name" header row hold the tag metadata
+    header = head.set_index(head.columns[0]).T
+    header.columns.name = None
+    header.index.name = HEADER_FIELDS[0]
+    return header.reset_index()
+
+
+def parse_timestamps(raw_index, fmt=TIMESTAMP_FORMAT):
+    ## Strict parse first, infer the format only for rows that do not match.
+    ## Rows that still cannot be parsed are NaT, later steps skip them.
+    ## Returns the index and the mask of rows not in the format
+    index = pd.to_datetime(raw_index, format=fmt, errors='coerce')
+    bad = np.asarray(index.isna() & pd.notna(raw_index))
+    if bad.any():
+        values = index.to_numpy(copy=True)
+        values[bad] = pd.to_datetime(raw_index[bad], errors='coerce').to_numpy()
+        index = pd.DatetimeIndex(values)
+    return pd.DatetimeIndex(index, name="Datetime"), bad
+
+
+def coerce_values(data, dtype=np.float64):
+    ## Columns the C parser already read as numbers are taken as-is, the rest are coerced
+    values = np.empty(data.shape, dtype=dtype)
+    for i, (_, col) in enumerate(data.items()):
+        if col.dtype.kind not in 'fiub':
+            col = pd.to_numeric(col, errors='coerce')
+        values[:, i] = col.to_numpy(dtype=dtype, na_value=np.nan)
+    return values
+
+
+def read_hist_csv(source, name=None, dtype=np.float64):
+    data_bytes = _to_bytes(source)
+    if name is None:
+        name = getattr(source, 'name', str(source) if isinstance(source, str) else None)
+
+    preview = pd.read_csv(io.BytesIO(data_bytes), nrows=6, dtype=str)
+    header = build_header(preview.iloc[:4])
+
+    data = pd.read_csv(io.BytesIO(data_bytes), skiprows=range(1, 5), index_col=0,
+                       dtype={preview.columns[0]: str}, low_memory=False)
+    index, bad = parse_timestamps(data.index)
+
+    return HistDataset(name=name, header=header, raw_index=arrow_strings(data.index),
+                       index=index, values=coerce_values(data, dtype=dtype),
+                       preview=preview, timestamp_format_ok=not bad.any(), key=content_key(data_bytes),
+                       bad_timestamps=bad)
+
+
+def _open_stream(source):
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source), True
+    if hasattr(source, 'read'):
+        return source, False
+    return open(source, 'rb'), True
+
+
+def scan_hist_csv(source, name=None, chunksize=50_000, keep_every=10, dtype=np.float64, progress=None):
+    ## Read a large export in chunks with bounded memory.
+    ## Quality statistics cover every row; only every keep_every-th row is kept for plotting
+    ## (keep_every=None keeps no rows). progress is called with the fraction of bytes read.
+    if name is None:
+        name = getattr(source, 'name', str(source) if isinstance(source, str) else None)
+    f, close = _open_stream(source)
+    try:
+        f.seek(0, io.SEEK_END)
+        total_size = f.tell() or 1
+        f.seek(0)
+        preview = pd.read_csv(f, nrows=6, dtype=str)
+        f.seek(0)
+        header = build_header(preview.iloc[:4])
+
+        missing = np.zeros(len(header), dtype=np.int64)
+        total_points = 0
+        start = end = min_interval = last_stamp = None
+        format_ok = True
+        kept_raw, kept_index, kept_values, kept_bad = [], [], [], []
+
+        reader = pd.read_csv(f, skiprows=range(1, 5), index_col=0, chunksize=chunksize,
+                             dtype={preview.columns[0]: str}, low_memory=False)
+        for chunk in reader:
+            index, bad = parse_timestamps(chunk.index)
+            format_ok = format_ok and not bad.any()
+            values = coerce_values(chunk, dtype=dtype)
+            missing += np.isnan(values).sum(axis=0)
+
+            ## Interval between consecutive timestamps, carried across chunk borders
+            stamps = index[~index.isna()]
+            if len(stamps):
+                chunk_start, chunk_end = stamps.min(), stamps.max()
+                start = chunk_start if start is None else min(start, chunk_start)
+                end = chunk_end if end is None else max(end, chunk_end)
+                if last_stamp is not None:
+                    stamps = stamps.insert(0, last_stamp)
+                steps = stamps[1:] - stamps[:-1]
+                steps = steps[steps > pd.Timedelta(0)]
+                if len(steps):
+                    chunk_min = steps.min()
+                    min_interval = chunk_min if min_interval is None else min(min_interval, chunk_min)
+                last_stamp = stamps[-1]
+
+            if keep_every:
+                keep = (total_points + np.arange(len(chunk))) % keep_every == 0
+                kept_raw.append(chunk.index[keep])
+                kept_index.append(index[keep])
+                kept_values.append(values[keep])
+                kept_bad.append(bad[keep])
+
+            total_points += len(chunk)
+            if progress is not None:
+                progress(min(f.tell() / total_size, 1.0))
+    finally:
+        if close:
+            f.close()
+
+    n_tags = len(header)
+    stats = HistStats(missing=pd.Series(missing / max(total_points, 1) * 100, index=pd.Index(header['Point Name'])),
+                      start=start, end=end, min_interval=min_interval, total_points=total_points)
+    if kept_values:
+        raw_index = arrow_strings(np.concatenate([np.asarray(raw, dtype=object) for raw in kept_raw]))
+        index = pd.DatetimeIndex(kept_index[0].append(kept_index[1:]), name="Datetime")
+        values = np.ascontiguousarray(np.concatenate(kept_values))
+        bad = np.concatenate(kept_bad)
+    else:
+        raw_index = arrow_strings([])
+        index = pd.DatetimeIndex([], name="Datetime")
+        values = np.empty((0, n_tags), dtype=dtype)
+        bad = np.zeros(0, dtype=bool)
+
+    return HistDataset(name=name, header=header, raw_index=raw_index, index=index, values=values,
+                       preview=preview, timestamp_format_ok=format_ok, stats=stats, keep_every=keep_every or 0,
+                       key=f'stream-{uuid.uuid4().hex}', bad_timestamps=bad)
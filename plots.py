@@ -0,0 +1,142 @@
+import io
+import warnings
+
+import numpy as np
+from matplotlib.figure import Figure
+
+
+## Min/max decimation : keep the lowest and highest sample of each bucket so peaks and
+## steps survive. Buckets without data keep one null sample so plotly still draws the gap.
+def minmax_indices(y, n_buckets):
+    n = len(y)
+    if n <= 2 * n_buckets:
+        return np.arange(n)
+
+    size = -(-n // n_buckets)
+    n_buckets = -(-n // size)
+    padded = np.full(n_buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(n_buckets, size)
+
+    empty = np.isnan(padded).all(axis=1)
+    lo = np.where(np.isnan(padded), np.inf, padded).argmin(axis=1)
+    hi = np.where(np.isnan(padded), -np.inf, padded).argmax(axis=1)
+    lo[empty] = 0
+    hi[empty] = 0
+
+    offset = np.arange(n_buckets) * size
+    picks = np.stack([np.minimum(lo, hi), np.maximum(lo, hi)], axis=1) + offset[:, None]
+    picks = np.unique(picks.ravel())
+    return picks[picks < n]
+
+
+def time_slice(index, start=None, end=None):
+    ## Row positions between start and end
+    if not index.is_monotonic_increasing:
+        inside = np.ones(len(index), dtype=bool)
+        if start is not None:
+            inside &= index >= start
+        if end is not None:
+            inside &= index <= end
+        return np.flatnonzero(inside)
+    first = 0 if start is None else index.searchsorted(start, side='left')
+    last = len(index) if end is None else index.searchsorted(end, side='right')
+    return slice(first, last)
+
+
+def column_range(values):
+    ## Min and max of each column, null for columns without data (or a matrix without rows)
+    if values.shape[0] == 0:
+        empty = np.full(values.shape[1], np.nan, dtype=values.dtype)
+        return empty, empty.copy()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanmin(values, axis=0), np.nanmax(values, axis=0)
+
+
+def decimated_traces(hist, columns, start=None, end=None, n_points=2000, normalize=False):
+    ## x/y pairs of the selected columns (short names) between start and end,
+    ## each reduced to about n_points samples
+    rows = time_slice(hist.index, start, end)
+    x = hist.index[rows]
+    positions = hist.short_columns.get_indexer(columns)
+
+    if normalize:
+        low, high = hist.cached('column_range', lambda: column_range(hist.values))
+
+    traces = []
+    for column, position in zip(columns, positions):
+        y = hist.values[rows, position]
+        if normalize:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                y = (y - low[position]) / (high[position] - low[position])
+        keep = minmax_indices(y, max(n_points // 2, 1))
+        traces.append((column, x[keep], y[keep]))
+    return traces
+
+
+## Data presence matrix : time is binned into pixel rows, each cell is shaded by the share of
+## samples present in the bin (grey when present, white when absent), drawn as one image.
+def presence_bins(present, n_bins):
+    n_rows = present.shape[0]
+    n_bins = max(min(n_bins, n_rows), 1)
+    edges = np.linspace(0, n_rows, n_bins + 1).astype(np.int64)[:-1]
+    if n_rows == 0:
+        return np.zeros((1, present.shape[1]))
+    sizes = np.diff(np.append(edges, n_rows))
+    ## Narrow counters are faster to add, uint16 holds any bin of up to 65535 rows
+    dtype = np.uint16 if sizes.max() <= np.iinfo(np.uint16).max else np.int64
+    counts = np.add.reduceat(present, edges, axis=0, dtype=dtype)
+    return counts / sizes[:, None]
+
+
+def render_matrix(present, index, columns, title, n_bins=400, dpi=100, max_labels=60):
+    share = presence_bins(present, n_bins)
+    n_tags = len(columns)
+    width, height = min(max(n_tags * 0.15, 6), 20), 5
+    fig = Figure(figsize=(width, height), dpi=dpi)
+    ## Fixed margins (inches) for the timestamps on the left and the tag labels on top,
+    ## a tight bounding box would lay the figure out twice
+    left, right, bottom, top = 1.2, 0.9, 0.1, 1.4
+    ax = fig.add_axes([left / width, bottom / height, 1 - (left + right) / width, 1 - (bottom + top) / height])
+
+    ## Column separators are drawn into the image : each tag gets `cell` pixel columns, the last one
+    ## white. With fewer than 3 pixels per tag there is no room for them.
+    image = 1 - 0.75 * share
+    cell = int((width - left - right) * dpi) // max(n_tags, 1)
+    if cell >= 3:
+        image = np.repeat(image, cell, axis=1)
+        image[:, cell - 1::cell] = 1
+    ax.imshow(image, cmap='gray', vmin=0, vmax=1, aspect='auto', interpolation='nearest',
+              extent=(-0.5, max(n_tags, 1) - 0.5, share.shape[0] - 0.5, -0.5))
+    fig.suptitle(title, y=1 - 0.15 / height, va='top')
+
+    ## At most max_labels tag labels, and no closer than 0.15 inch
+    ax.xaxis.tick_top()
+    max_labels = max(min(max_labels, int((width - left - right) / 0.15)), 1)
+    step = max(-(-n_tags // max_labels), 1)
+    ticks = np.arange(0, n_tags, step)
+    ax.set_xticks(ticks)
+    ax.set_xticklabels(np.asarray(columns)[ticks], rotation=45, ha='left', fontsize=7)
+    if len(index):
+        ax.set_yticks([0, share.shape[0] - 1])
+        ax.set_yticklabels([str(index[0]), str(index[-1])], fontsize=7)
+    else:
+        ax.set_yticks([])
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+
+def missing_matrix_png(hist, n_bins=400):
+    return hist.cached(('missing_matrix', n_bins), lambda: render_matrix(
+        ~np.isnan(hist.values), hist.index, hist.short_columns,
+        "Matrix visualization patterns in data completion", n_bins=n_bins))
+
+
+def freeze_matrix_png(hist, window, n_bins=400):
+    freeze_runs = hist.freeze_runs()
+    return hist.cached(('freeze_matrix', freeze_runs.tol, window, n_bins), lambda: render_matrix(
+        ~freeze_runs.mask(window), hist.index, hist.short_columns,
+        "Matrix visualization freeze data", n_bins=n_bins))
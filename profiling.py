@@ -0,0 +1,96 @@
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+
+
+HISTORY_COLUMNS = ['Rerun', 'Time', 'Stage', 'Wall (ms)', 'Peak process memory (MB)', 'Payload (KB)']
+
+## tracemalloc traces the whole process. Stages of every session share one tracing, started by the
+## first stage that needs it and stopped when the last one ends (unless it was already on).
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_started = False
+
+
+def _start_tracing():
+    global _tracing_users, _tracing_started
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_started = True
+        _tracing_users += 1
+
+
+def _stop_tracing():
+    global _tracing_users, _tracing_started
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _tracing_started:
+            tracemalloc.stop()
+            _tracing_started = False
+
+
+def payload_size(obj):
+    ## Approximate bytes sent to the browser for an element
+    if obj is None:
+        return 0
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        df = obj.to_frame() if isinstance(obj, pd.Series) else obj
+        return pa.Table.from_pandas(df).nbytes
+    if hasattr(obj, 'to_json'):
+        return len(obj.to_json())
+    return 0
+
+
+## Opt-in per-stage instrumentation of one rerun : wall time, peak traced memory and payload size.
+## When disabled every call is a no-op, so stages can stay wrapped in production.
+## The peak is process-wide : allocations of other sessions and of the Summary threads during the
+## stage are included, and stages running at the same time reset the same peak.
+class Profiler:
+    def __init__(self, enabled=False, rerun=0):
+        self.enabled = enabled
+        self.rerun = rerun
+        self.records = []
+        self._current = None
+        self._payload_time = 0.0
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield self
+            return
+        _start_tracing()
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        record = {'Rerun': self.rerun, 'Time': datetime.now().isoformat(timespec='seconds'), 'Stage': name, 'Payload (KB)': 0.0}
+        self._current = record
+        self._payload_time = 0.0
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            ## Time spent measuring payloads is not part of the stage
+            record['Wall (ms)'] = round((time.perf_counter() - start - self._payload_time) * 1000, 2)
+            _, peak = tracemalloc.get_traced_memory()
+            record['Peak process memory (MB)'] = round(max(peak - base, 0) / 1024**2, 3)
+            _stop_tracing()
+            self._current = None
+            self.records.append(record)
+
+    def payload(self, obj):
+        ## Add the size of an element sent to the browser to the current stage, returns obj
+        if self.enabled and self._current is not None:
+            start = time.perf_counter()
+            self._current['Payload (KB)'] += round(payload_size(obj) / 1024, 2)
+            self._payload_time += time.perf_counter() - start
+        return obj
+
+    def frame(self):
+        return pd.DataFrame(self.records, columns=HISTORY_COLUMNS)
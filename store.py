@@ -0,0 +1,339 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+import weakref
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc
+
+from freeze import FreezeRuns
+from hist import HistDataset, HistStats
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'historical-check')
+DEFAULT_CACHE_MAX_MB = 2048
+DEFAULT_SESSION_MAX_MB = 512
+DEFAULT_PROCESS_MAX_MB = 2048
+## Layout of an entry, entries written with another layout are dropped on load
+STORE_FORMAT = 3
+
+
+def _env_bytes(name, default_mb):
+    return int(float(os.environ.get(name, default_mb)) * 1024**2)
+
+
+def _write_table(path, table):
+    if isinstance(table, pd.DataFrame):
+        table = pa.Table.from_pandas(table, preserve_index=False)
+    with pa.OSFile(path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def _read_table(path):
+    ## Arrow IPC files are memory-mapped, column buffers point into the mapping (the page cache).
+    ## The mapping stays open as long as a buffer of the table is alive.
+    return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+
+def _data_table(hist):
+    ## Timestamps as int64 nanoseconds, raw timestamps as strings and the values matrix as one
+    ## fixed size list column, so its child buffer is the (rows x tags) matrix in row-major order
+    index = hist.index.to_numpy(dtype='datetime64[ns]').view(np.int64)
+    raw_index = hist.raw_index.array
+    if not isinstance(raw_index, pd.arrays.ArrowStringArray):
+        raw_index = np.asarray(raw_index, dtype=object)
+    raw_index = pa.array(raw_index, type=pa.string(), from_pandas=True)
+    columns = {'index': pa.array(index), 'raw_index': raw_index}
+    if hist.bad_timestamps is not None:
+        columns['bad_timestamp'] = pa.array(hist.bad_timestamps)
+    n_tags = hist.values.shape[1]
+    if n_tags:
+        values = pa.array(np.ascontiguousarray(hist.values).ravel())
+        columns['values'] = pa.FixedSizeListArray.from_arrays(values, n_tags)
+    return pa.table(columns)
+
+
+def _runs_table(runs):
+    return pa.table({'tag': runs.run_tag, 'first': runs.run_first, 'length': runs.run_length_total})
+
+
+def _json_value(value):
+    ## None and NaT are written as JSON null
+    return None if value is None or pd.isna(value) else str(value)
+
+
+def _buffer(column):
+    ## Single contiguous chunk of a column, without a copy when it was written as one batch
+    return column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+
+
+## On-disk cache of parsed historical datasets, one directory per file content hash.
+## data.arrow holds the timestamps and the values matrix, header.arrow and preview.arrow the
+## metadata, runs.arrow the freeze run table found before the values were rounded to float32.
+## Reloads read the timestamps and values in place from the memory-mapped file and keep the raw
+## timestamps as Arrow strings. Entries are evicted least-recently-used once the total size passes
+## max_bytes.
+class HistStore:
+    def __init__(self, root=None, max_bytes=None):
+        self.root = root or os.environ.get('HIST_CACHE_DIR', DEFAULT_CACHE_DIR)
+        if max_bytes is None:
+            max_bytes = _env_bytes('HIST_CACHE_MAX_MB', DEFAULT_CACHE_MAX_MB)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pinned = Counter()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def __contains__(self, key):
+        return key is not None and os.path.exists(os.path.join(self._path(key), 'meta.json'))
+
+    ## Pinned entries hold data spilled from a session and are never evicted
+    def pin(self, key):
+        with self._lock:
+            self._pinned[key] += 1
+
+    def unpin(self, key):
+        with self._lock:
+            self._pinned[key] -= 1
+            if self._pinned[key] <= 0:
+                del self._pinned[key]
+
+    def save(self, hist):
+        if hist.key is None:
+            hist.key = f'stream-{uuid.uuid4().hex}'
+        if hist.key in self:
+            return
+        path = self._path(hist.key)
+        tmp_path = f'{path}.tmp{os.getpid()}_{threading.get_ident()}'
+        os.makedirs(tmp_path, exist_ok=True)
+        try:
+            _write_table(os.path.join(tmp_path, 'data.arrow'), _data_table(hist))
+            _write_table(os.path.join(tmp_path, 'header.arrow'), hist.header)
+            _write_table(os.path.join(tmp_path, 'preview.arrow'), hist.preview)
+            if hist.runs is not None:
+                _write_table(os.path.join(tmp_path, 'runs.arrow'), _runs_table(hist.runs))
+            with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+                meta = {'format': STORE_FORMAT, 'name': hist.name, 'timestamp_format_ok': hist.timestamp_format_ok, 'dtype': hist.values.dtype.str,
+                        'n_tags': hist.values.shape[1], 'keep_every': hist.keep_every, 'saved': time.time()}
+                if hist.stats is not None:
+                    meta['stats'] = {'missing': hist.stats.missing.tolist(), 'start': _json_value(hist.stats.start),
+                                     'end': _json_value(hist.stats.end), 'min_interval': _json_value(hist.stats.min_interval),
+                                     'total_points': hist.stats.total_points}
+                if hist.runs is not None:
+                    meta['runs'] = {'tol': hist.runs.tol, 'first_valid': hist.runs.first_valid.tolist()}
+                json.dump(meta, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            if not os.path.exists(path):
+                raise
+        self.evict()
+
+    def load(self, key, name=None):
+        if key not in self:
+            self.misses += 1
+            return None
+        path = self._path(key)
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('format') != STORE_FORMAT:
+            shutil.rmtree(path, ignore_errors=True)
+            self.misses += 1
+            return None
+        data = _read_table(os.path.join(path, 'data.arrow'))
+        header = _read_table(os.path.join(path, 'header.arrow')).to_pandas()
+        preview = _read_table(os.path.join(path, 'preview.arrow')).to_pandas()
+
+        if 'values' in data.column_names:
+            values = _buffer(data.column('values')).flatten().to_numpy(zero_copy_only=True)
+            values = values.reshape(data.num_rows, meta['n_tags'])
+        else:
+            values = np.empty((data.num_rows, 0), dtype=np.dtype(meta['dtype']))
+        index = _buffer(data.column('index')).to_numpy(zero_copy_only=True).view('datetime64[ns]')
+        index = pd.DatetimeIndex(index, name="Datetime", copy=False)
+        raw_index = pd.Index(pd.arrays.ArrowStringArray(data.column('raw_index')))
+        bad_timestamps = None
+        if 'bad_timestamp' in data.column_names:
+            bad_timestamps = data.column('bad_timestamp').to_numpy()
+
+        stats = None
+        if 'stats' in meta:
+            saved = meta['stats']
+            stats = HistStats(missing=pd.Series(saved['missing'], index=pd.Index(header['Point Name'])),
+                              start=pd.Timestamp(saved['start']) if saved['start'] is not None else None,
+                              end=pd.Timestamp(saved['end']) if saved['end'] is not None else None,
+                              min_interval=pd.Timedelta(saved['min_interval']) if saved['min_interval'] is not None else None,
+                              total_points=saved['total_points'])
+
+        runs = None
+        if 'runs' in meta:
+            table = _read_table(os.path.join(path, 'runs.arrow'))
+            runs = FreezeRuns.from_table(index, meta['n_tags'], meta['runs']['first_valid'],
+                                         *(_buffer(table.column(c)).to_numpy() for c in ('tag', 'first', 'length')),
+                                         tol=meta['runs']['tol'])
+
+        os.utime(path)
+        self.hits += 1
+        return HistDataset(name=name or meta['name'], header=header, raw_index=raw_index, index=index,
+                           values=values, preview=preview, timestamp_format_ok=meta['timestamp_format_ok'],
+                           stats=stats, keep_every=meta.get('keep_every', 1), key=key, bad_timestamps=bad_timestamps,
+                           runs=runs)
+
+    def entries(self):
+        ## (key, bytes, last used) of every entry
+        entries = []
+        for key in os.listdir(self.root):
+            path = self._path(key)
+            if '.tmp' in key or not os.path.isdir(path):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            entries.append((key, size, os.path.getmtime(path)))
+        return entries
+
+    @property
+    def nbytes(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        with self._lock:
+            entries = sorted(self.entries(), key=lambda e: e[2])
+            total = sum(size for _, size, _ in entries)
+            for key, size, _ in entries:
+                if total <= self.max_bytes:
+                    break
+                if key in self._pinned:
+                    continue
+                shutil.rmtree(self._path(key), ignore_errors=True)
+                total -= size
+
+
+## Memory limit shared by every browser session of the server process
+class MemoryBudget:
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes if max_bytes is not None else _env_bytes('HIST_PROCESS_MAX_MB', DEFAULT_PROCESS_MAX_MB)
+        self._sessions = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def register(self, session):
+        with self._lock:
+            self._sessions.add(session)
+
+    @property
+    def nbytes(self):
+        return sum(session.nbytes for session in list(self._sessions))
+
+    def enforce(self, keep=None):
+        ## Spill the least recently viewed units of any session until the process is under budget
+        with self._lock:
+            loaded = [(session.last_viewed[unit], session, unit) for session in list(self._sessions)
+                      for unit in session.resident_units()]
+            total = sum(session.nbytes for session in list(self._sessions))
+            for _, session, unit in sorted(loaded, key=lambda e: e[0]):
+                if total <= self.max_bytes:
+                    break
+                if (session, unit) == keep:
+                    continue
+                total -= session.spill(unit)
+
+
+## Historical data of every unit for one browser session. Datasets are kept compact (float32 values,
+## categorical header fields). Least recently viewed units are spilled to the disk store when the
+## session or the process goes over budget and are reloaded when viewed again.
+class SessionHistStore:
+    def __init__(self, units, disk, budget=None, max_bytes=None):
+        self.units = list(units)
+        self.disk = disk
+        self.budget = budget
+        self.max_bytes = max_bytes if max_bytes is not None else _env_bytes('HIST_SESSION_MAX_MB', DEFAULT_SESSION_MAX_MB)
+        self.last_viewed = {}
+        self._resident = {}
+        self._spilled = {}
+        self._lock = threading.RLock()
+        if budget is not None:
+            budget.register(self)
+
+    def __del__(self):
+        for key in self._spilled.values():
+            self.disk.unpin(key)
+
+    def __contains__(self, unit):
+        return unit in self._resident or unit in self._spilled
+
+    def __getitem__(self, unit):
+        with self._lock:
+            hist = self._resident.get(unit)
+            if hist is None and unit in self._spilled:
+                key = self._spilled.pop(unit)
+                hist = self.disk.load(key)
+                self.disk.unpin(key)
+                if hist is not None:
+                    hist = self._resident[unit] = hist.compact()
+            if hist is not None:
+                self.last_viewed[unit] = time.monotonic()
+        if hist is not None:
+            self.enforce(keep=unit)
+        return hist
+
+    def __setitem__(self, unit, hist):
+        with self._lock:
+            if unit in self._spilled:
+                self.disk.unpin(self._spilled.pop(unit))
+            self._resident[unit] = hist.compact()
+            self.last_viewed[unit] = time.monotonic()
+        self.enforce(keep=unit)
+
+    def peek(self, unit):
+        ## Dataset if it is in memory, without reloading it or changing the view order
+        return self._resident.get(unit)
+
+    def resident_units(self):
+        return list(self._resident)
+
+    @property
+    def nbytes(self):
+        return sum(hist.nbytes for hist in list(self._resident.values()))
+
+    def spill(self, unit):
+        ## Move a unit to disk, returns the bytes released
+        with self._lock:
+            hist = self._resident.pop(unit, None)
+            if hist is None:
+                return 0
+            if hist.key is None:
+                hist.key = f'stream-{uuid.uuid4().hex}'
+            self.disk.pin(hist.key)
+            self.disk.save(hist)
+            self._spilled[unit] = hist.key
+            return hist.nbytes
+
+    def enforce(self, keep=None):
+        with self._lock:
+            total = self.nbytes
+            for unit in sorted(self._resident, key=lambda u: self.last_viewed.get(u, 0)):
+                if total <= self.max_bytes:
+                    break
+                if unit != keep:
+                    total -= self.spill(unit)
+        if self.budget is not None:
+            self.budget.enforce(keep=(self, keep))
+
+    def usage(self):
+        ## Memory readout, one row per unit
+        rows = []
+        for unit in self.units:
+            if unit in self._resident:
+                rows.append({'Unit': unit, 'Status': 'In memory', 'Memory (MB)': round(self._resident[unit].nbytes / 1024**2, 1)})
+            elif unit in self._spilled:
+                rows.append({'Unit': unit, 'Status': 'On disk', 'Memory (MB)': 0.0})
+        return pd.DataFrame(rows, columns=['Unit', 'Status', 'Memory (MB)'])
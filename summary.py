@@ -0,0 +1,65 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from checks import unit_scorecard
+
+
+## Scorecards computed in background threads as soon as a unit's data is uploaded.
+## Results are kept per (TDT, unit, data content, window), so uploading one unit only
+## computes that unit and reloading the same file reuses the earlier result.
+class SummaryWorker:
+    def __init__(self, max_workers=2, max_entries=256):
+        self.max_entries = max_entries
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='summary')
+        self._futures = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(tdt_key, unit, hist, roll_hr):
+        return (tdt_key, unit, hist.key, roll_hr)
+
+    def submit(self, tdt_key, unit, df_unit, hist, roll_hr=6):
+        key = self.key(tdt_key, unit, hist, roll_hr)
+        with self._lock:
+            if key in self._futures:
+                self._futures.move_to_end(key)
+                return self._futures[key]
+            future = self._executor.submit(unit_scorecard, df_unit, hist, roll_hr)
+            self._futures[key] = future
+            while len(self._futures) > self.max_entries:
+                self._futures.popitem(last=False)
+            return future
+
+
+def unit_overview(unit, future):
+    ## One row of the plant overview
+    row = {'Unit': unit, 'Status': 'Not uploaded', 'Tags': None, 'Header issues': None, 'Timestamp valid': None,
+           'Missing (%)': None, 'Freeze (%)': None, 'Coverage start': None, 'Coverage end': None}
+    if future is None:
+        return row
+    if not future.done():
+        row['Status'] = 'Computing'
+        return row
+    if future.exception() is not None:
+        row['Status'] = f'Error : {future.exception()}'
+        return row
+    scorecard = future.result()
+    row.update({
+        'Status': 'Done',
+        'Tags': len(scorecard),
+        'Header issues': int((scorecard['Header'] != 'Match').sum()),
+        'Timestamp valid': bool(scorecard['Timestamp valid'].all()),
+        'Missing (%)': round(float(np.nanmean(scorecard['Missing (%)'])), 2) if scorecard['Missing (%)'].notna().any() else None,
+        'Freeze (%)': round(float(np.nanmean(scorecard['Freeze (%)'])), 2) if scorecard['Freeze (%)'].notna().any() else None,
+        'Coverage start': scorecard['Coverage start'].min(),
+        'Coverage end': scorecard['Coverage end'].max(),
+    })
+    return row
+
+
+def plant_overview(units, futures):
+    return pd.DataFrame([unit_overview(unit, futures.get(unit)) for unit in units])
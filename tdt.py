@@ -0,0 +1,84 @@
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import pandas as pd
+
+
+## Parsed "Point Survey" sheet of a TDT workbook
+@dataclass
+class TdtWorkbook:
+    key: str
+    name: str
+    plant_units: pd.Index
+    units_tdt: dict
+
+
+def content_key(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def parse_point_survey(data, key=None):
+    ## Read TDT excel file page "Point Survey"
+    df_tdt = pd.read_excel(io.BytesIO(data), sheet_name="Point Survey")
+    df_tdt = df_tdt.drop(columns=["Unnamed: 0"])
+
+    ## Remove none matric rows
+    df_dropna = df_tdt[~(df_tdt.iloc[:,0].str.contains("Metric Name|Add additional metrics as needed"))]
+
+    ## Find plant unit
+    plant_units = df_dropna.columns
+    plant_units = plant_units[~plant_units.str.contains("Unnamed")]
+    plant_units = plant_units.drop(plant_units[0])
+    num_unit = len(plant_units)
+
+    ## Create dataframe contain metric name and type
+    df_metrics = df_dropna.iloc[:,0:2].copy()
+
+    ## Create dataframe of each unit and contain to dict
+    units_tdt = dict()
+    for i in range(num_unit):
+        df_unit_point_name = df_dropna.iloc[:,i*5+2:i*5+7]
+
+        df_unit_point_survey = pd.concat([df_metrics, df_unit_point_name], axis=1)
+        df_unit_point_survey.columns = df_unit_point_survey.iloc[0].tolist()
+        df_unit_point_survey = df_unit_point_survey.drop(0)
+
+        units_tdt[plant_units[i]] = df_unit_point_survey
+
+    return TdtWorkbook(key=key or content_key(data), name=df_tdt.columns[0],
+                       plant_units=plant_units, units_tdt=units_tdt)
+
+
+## Bounded LRU cache of parsed workbooks keyed by content hash of the xlsx.
+## Cached frames are shared between reruns and sessions, so callers must not modify them in place.
+class TdtCache:
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, data):
+        key = content_key(data)
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+
+        workbook = parse_point_survey(data, key=key)
+
+        with self._lock:
+            self._entries[key] = workbook
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return workbook
+
+    def __len__(self):
+        return len(self._entries)